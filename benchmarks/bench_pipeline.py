@@ -0,0 +1,152 @@
+import io
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_data import generate
+from project.main_menu import (load_recipes, load_ingredients, load_pantry_bulk, load_preferences, recommend_recipes,
+                               RecipeCatalog, CompactRecipeCatalog, create_meal_plan, parse_meal_plan, generate_shopping_list)
+
+DEFAULT_SCALES = [10, 100, 1000, 10000]
+
+# Runs stage() quietly `repeat` times for wall time, then once more under
+# tracemalloc for the peak Python memory it allocates
+def measure(stage, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = stage()
+            times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stage()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {
+        'seconds_min': min(times),
+        'seconds_median': statistics.median(times),
+        'peak_bytes': peak,
+    }
+
+# Times every pipeline stage against one generated catalog size
+def bench_scale(recipe_count, directory, repeat, seed):
+    recipes_file, ingredients_file, preferences_file = generate(directory, recipe_count, seed)
+    meal_plan_file = os.path.join(directory, 'meal_plan.txt')
+    stages = {}
+
+    recipes, stages['load_recipes'] = measure(lambda: load_recipes(recipes_file, use_cache=False), repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_recipes(recipes_file)  # Builds the compiled cache for the next stage
+        selected_diet = load_preferences(preferences_file, use_cache=False)['user_preferences'][0]
+    _, stages['load_recipes_cached'] = measure(lambda: load_recipes(recipes_file), repeat)
+    pantry, stages['load_ingredients'] = measure(lambda: load_ingredients(ingredients_file, use_cache=False), repeat)
+    _, stages['load_pantry_bulk'] = measure(lambda: load_pantry_bulk(ingredients_file), repeat)
+    preferences = {'selected_preference': selected_diet}
+
+    catalog, stages['build_catalog'] = measure(lambda: RecipeCatalog(recipes), repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        CompactRecipeCatalog.from_file(recipes_file)  # Builds its compiled cache
+    _, stages['load_compact_catalog'] = measure(lambda: CompactRecipeCatalog.from_file(recipes_file), repeat)
+    recommended, stages['recommend_recipes'] = measure(lambda: recommend_recipes(catalog, preferences), repeat)
+    meal_plan, stages['create_meal_plan'] = measure(
+        lambda: create_meal_plan(recommended, selected_diet, meal_plan_file, seed=seed), repeat)
+    _, stages['parse_meal_plan'] = measure(lambda: parse_meal_plan(meal_plan_file), repeat)
+    _, stages['generate_shopping_list'] = measure(
+        lambda: generate_shopping_list(meal_plan_file, recipes_file, ingredients_file, None), repeat)
+    _, stages['generate_shopping_list_in_memory'] = measure(
+        lambda: generate_shopping_list(meal_plan, catalog, pantry, None), repeat)
+
+    return {
+        'recipes': recipe_count,
+        'recommended': len(recommended),
+        'file_bytes': os.path.getsize(recipes_file),
+        'stages': stages,
+    }
+
+# Slope of log(time) against log(recipes) per stage: ~1 is linear, ~2 quadratic
+def scaling_exponents(results):
+    exponents = {}
+    sizes = [math.log(result['recipes']) for result in results]
+    if len(sizes) < 2:
+        return exponents
+    for stage in results[0]['stages']:
+        times = [math.log(max(result['stages'][stage]['seconds_median'], 1e-9)) for result in results]
+        mean_size, mean_time = statistics.mean(sizes), statistics.mean(times)
+        spread = sum((size - mean_size) ** 2 for size in sizes)
+        exponents[stage] = round(sum((size - mean_size) * (t - mean_time) for size, t in zip(sizes, times)) / spread, 3)
+    return exponents
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+# Prints how every stage changed against an earlier results file
+def compare(results, baseline_filename):
+    with open(baseline_filename) as file:
+        baseline = json.load(file)
+    previous = {run['recipes']: run['stages'] for run in baseline['runs']}
+    print(f"\nCompared with {baseline_filename} ({baseline.get('revision')}):")
+    for run in results['runs']:
+        if run['recipes'] not in previous:
+            continue
+        for stage, timing in run['stages'].items():
+            before = previous[run['recipes']].get(stage)
+            if before:
+                ratio = timing['seconds_median'] / max(before['seconds_median'], 1e-9)
+                print(f"  {run['recipes']:>8} recipes  {stage:<34} {ratio:6.2f}x")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every meal planner pipeline stage on synthetic catalogs")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="catalog sizes in recipes (10 to 1,000,000)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    runs = []
+    for recipe_count in args.scales:
+        with tempfile.TemporaryDirectory() as directory:
+            run = bench_scale(recipe_count, directory, args.repeat, args.seed)
+        runs.append(run)
+        print(f"{recipe_count} recipes:")
+        for stage, timing in run['stages'].items():
+            print(f"  {stage:<34} {timing['seconds_median'] * 1000:10.2f} ms  {timing['peak_bytes'] / 1e6:9.2f} MB peak")
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'runs': runs,
+        'scaling_exponents': scaling_exponents(runs),
+    }
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    sys.exit(main())
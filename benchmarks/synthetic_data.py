@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import math
+import random
+import argparse
+
+# Share of recipes per diet tag, roughly what the real recipes.json has
+TAG_WEIGHTS = {"Omni": 0.40, "Veg": 0.25, "Pesc": 0.15, "All": 0.20}
+
+# Ingredients per recipe, most recipes use 2-4 like the real catalog
+INGREDIENT_COUNT_WEIGHTS = {2: 0.22, 3: 0.40, 4: 0.20, 5: 0.10, 6: 0.05, 7: 0.02, 8: 0.01}
+
+# Units ingredients are measured in, with a typical quantity range for one recipe
+UNITS = [
+    ("cup", 0.25, 2), ("tbsp", 1, 4), ("tsp", 0.5, 3), ("oz", 2, 10),
+    ("slice", 1, 4), ("clove", 1, 4), ("piece", 1, 3),
+]
+
+DIETS = [
+    {"diet": "omnivore", "nutritional_goals": {"calories": 2000, "protein": 120, "carbs": 220, "fat": 70, "fiber": 30}},
+    {"diet": "vegetarian", "nutritional_goals": {"calories": 1600, "protein": 75, "carbs": 210, "fat": 55, "fiber": 40}},
+    {"diet": "vegan", "nutritional_goals": {"calories": 1400, "protein": 60, "carbs": 210, "fat": 50, "fiber": 35}},
+    {"diet": "pescatarian", "nutritional_goals": {"calories": 1800, "protein": 140, "carbs": 180, "fat": 70, "fiber": 25}},
+]
+
+# Ingredient vocabulary grows slower than the catalog, like real recipe sites do
+def vocabulary_size(recipe_count):
+    return max(20, int(30 * math.sqrt(recipe_count)))
+
+def make_vocabulary(size, rng):
+    vocabulary = []
+    for index in range(size):
+        unit, low, high = rng.choice(UNITS)
+        vocabulary.append((f"ingredient {index}", unit, low, high))
+    return vocabulary
+
+def make_recipe(index, vocabulary, ingredient_weights, rng):
+    count = rng.choices(list(INGREDIENT_COUNT_WEIGHTS), weights=list(INGREDIENT_COUNT_WEIGHTS.values()))[0]
+    # Popular ingredients (onion, rice, ...) show up far more often, so ingredients
+    # are drawn from a Zipf-like distribution over the vocabulary
+    chosen = set()
+    while len(chosen) < min(count, len(vocabulary)):
+        chosen.add(rng.choices(range(len(vocabulary)), cum_weights=ingredient_weights)[0])
+
+    ingredients = []
+    for position in sorted(chosen):
+        name, unit, low, high = vocabulary[position]
+        quantity = round(rng.uniform(low, high) * 4) / 4 or low
+        ingredients.append({"ingredient": name, "quantity": quantity, "unit": unit})
+
+    # Macros that add up to the calories (4 kcal/g protein and carbs, 9 kcal/g fat)
+    calories = round(rng.uniform(60, 800), 1)
+    protein_share, carbs_share = rng.uniform(0.1, 0.45), rng.uniform(0.2, 0.6)
+    fat_share = max(0.05, 1 - protein_share - carbs_share)
+    total_share = protein_share + carbs_share + fat_share
+    return {
+        "name": f"Recipe {index}",
+        "tags": [rng.choices(list(TAG_WEIGHTS), weights=list(TAG_WEIGHTS.values()))[0]],
+        "ingredients": ingredients,
+        "nutrition": {
+            "calories": calories,
+            "protein": round(calories * protein_share / total_share / 4, 1),
+            "carbs": round(calories * carbs_share / total_share / 4, 1),
+            "fat": round(calories * fat_share / total_share / 9, 1),
+            "fiber": round(rng.uniform(0, 15), 1),
+        },
+    }
+
+# Writes recipes.json, ingredients.csv and preferences.json for recipe_count recipes
+# into directory and returns their paths. Recipes are written one at a time so a
+# million recipe catalog never has to be held in memory.
+def generate(directory, recipe_count, seed=0, pantry_size=None, profile_count=4):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    vocabulary = make_vocabulary(vocabulary_size(recipe_count), rng)
+    ingredient_weights = []
+    running = 0
+    for rank in range(1, len(vocabulary) + 1):
+        running += 1 / rank
+        ingredient_weights.append(running)
+
+    recipes_file = os.path.join(directory, 'recipes.json')
+    with open(recipes_file, 'w') as file:
+        file.write('{"recipes": [\n')
+        for index in range(recipe_count):
+            if index:
+                file.write(',\n')
+            file.write(json.dumps(make_recipe(index, vocabulary, ingredient_weights, rng)))
+        file.write('\n]}\n')
+
+    # Pantry in the same layout as the real ingredients.csv, including the spaces
+    ingredients_file = os.path.join(directory, 'ingredients.csv')
+    pantry_size = min(len(vocabulary), pantry_size or max(10, len(vocabulary) // 10))
+    with open(ingredients_file, 'w') as file:
+        file.write("ingredient, quantity, unit\n")
+        for name, unit, low, high in rng.sample(vocabulary, pantry_size):
+            file.write(f"{name},{round(rng.uniform(low, high * 5), 2)}, {unit}\n")
+
+    preferences_file = os.path.join(directory, 'preferences.json')
+    profiles = []
+    for index in range(profile_count):
+        profile = json.loads(json.dumps(DIETS[index % len(DIETS)]))
+        if profile_count > len(DIETS):
+            profile["user_id"] = f"user{index + 1}"
+        profiles.append(profile)
+    with open(preferences_file, 'w') as file:
+        json.dump({"user_preferences": profiles}, file, indent=2)
+
+    return recipes_file, ingredients_file, preferences_file
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic meal planner data files")
+    parser.add_argument('directory')
+    parser.add_argument('--recipes', type=int, default=1000, help="number of recipes (10 to 1,000,000)")
+    parser.add_argument('--profiles', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for filename in generate(args.directory, args.recipes, args.seed, profile_count=args.profiles):
+        print(f"Wrote {filename}")
+
+if __name__ == "__main__":
+    sys.exit(main())
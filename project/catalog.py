@@ -0,0 +1,545 @@
+import sys
+import json
+import hashlib
+from array import array
+from collections.abc import Mapping, Sequence
+import numpy as np
+
+from project.metrics import instrumented
+from project.loaders import (NUTRIENTS, RECIPE_KEYS, UNIT_CONVERSIONS, _load_recipes, _stream_recipes, is_store_file,
+                             iter_valid_recipes, load_cached_version, normalize_unit)
+from project.store import MealPlannerStore
+
+# What a catalog needs to index a recipe: a name, ingredients (if any) that each
+# name the ingredient and give a number for its quantity, and numbers for whichever
+# nutrients it lists
+def _is_catalog_entry(recipe):
+    if not isinstance(recipe, Mapping) or "name" not in recipe:
+        return False
+    ingredients = recipe.get("ingredients", [])
+    if not isinstance(ingredients, list):
+        return False
+    if not all(isinstance(ingredient, Mapping) and isinstance(ingredient.get("ingredient"), str)
+               and isinstance(ingredient.get("quantity"), (int, float)) for ingredient in ingredients):
+        return False
+    nutrition = recipe.get("nutrition") or {}
+    return isinstance(nutrition, Mapping) and all(isinstance(nutrition.get(key, 0), (int, float)) for key in NUTRIENTS)
+
+# Indexed catalog built once from load_recipes so name, tag and ingredient
+# lookups are hash/set operations instead of scans over the whole recipe list
+class RecipeCatalog:
+    def __init__(self, recipes=()):
+        self.recipes = []        # recipe id -> recipe
+        self.by_name = {}        # recipe name -> recipe
+        self.by_tag = {}         # lowercased tag -> set of recipe ids
+        self.by_ingredient = {}  # lowercased ingredient name -> set of recipe ids
+        self._ingredient_matrix = None
+        self._content_version = None
+        self.source = None          # recipes file the catalog was loaded from, if any
+        self.source_version = None  # sha256 of that file's contents as they were parsed
+        for recipe in recipes:
+            self.add(recipe)
+
+    @classmethod
+    def from_file(cls, filename: str):
+        recipes, version = _load_recipes(filename)
+        catalog = cls(recipes)
+        catalog.source, catalog.source_version = filename, version
+        return catalog
+
+    # Changes whenever the recipes do: the hash of the file as it was loaded (not as
+    # it is on disk now), or a hash of the recipes themselves for catalogs built in memory
+    @property
+    def version(self):
+        if self.source_version is not None:
+            return self.source_version
+        if self._content_version is None:
+            content = json.dumps(self.recipes, sort_keys=True, default=str)
+            self._content_version = hashlib.sha256(content.encode()).hexdigest()
+        return self._content_version
+
+    def add(self, recipe):
+        # Same shape checks recommend_recipes always did, malformed entries are ignored
+        if not _is_catalog_entry(recipe):
+            return None
+        recipe_id = len(self.recipes)
+        self.recipes.append(recipe)
+        self._ingredient_matrix = None
+        self._content_version = None
+        self.source_version = None
+        # Keep the first recipe for a duplicated name, like the old next(...) lookup
+        self.by_name.setdefault(recipe["name"], recipe)
+
+        tags = recipe.get("tags")
+        if isinstance(tags, list):
+            for tag in tags:
+                if isinstance(tag, str):
+                    self.by_tag.setdefault(tag.lower(), set()).add(recipe_id)
+
+        for ingredient in recipe.get("ingredients", []):
+            ingredient_name = ingredient["ingredient"].strip().lower()
+            self.by_ingredient.setdefault(ingredient_name, set()).add(recipe_id)
+        return recipe_id
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def __iter__(self):
+        return iter(self.recipes)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def ids_with_tags(self, *tags):
+        ids = set()
+        for tag in tags:
+            ids |= self.by_tag.get(tag.lower(), set())
+        return ids
+
+    def ids_using_ingredient(self, ingredient):
+        return self.by_ingredient.get(ingredient.strip().lower(), set())
+
+    # Recipes come back in catalog order so results match the old list scans
+    def with_tags(self, *tags):
+        return [self.recipes[i] for i in sorted(self.ids_with_tags(*tags))]
+
+    def using_ingredient(self, ingredient):
+        return [self.recipes[i] for i in sorted(self.ids_using_ingredient(ingredient))]
+
+    # Number of ingredients in every recipe, by recipe id
+    def ingredient_counts(self):
+        return np.array([len(recipe.get("ingredients", [])) for recipe in self.recipes], dtype=np.int64)
+
+    # Recipe x ingredient quantity matrix for shopping lists, built on first use
+    def ingredient_matrix(self):
+        if self._ingredient_matrix is None:
+            self._ingredient_matrix = IngredientMatrix(self.recipes)
+        return self._ingredient_matrix
+
+# Read-only dict view of one recipe in a CompactRecipeCatalog, built from its columns
+# on access, so code written for recipe dicts keeps working
+class RecipeView(Mapping):
+    __slots__ = ('catalog', 'id')
+    KEYS = RECIPE_KEYS
+
+    def __init__(self, catalog, recipe_id):
+        self.catalog = catalog
+        self.id = recipe_id
+
+    def __getitem__(self, key):
+        catalog, recipe_id = self.catalog, self.id
+        if key == "name":
+            return catalog.names[recipe_id]
+        if key == "tags":
+            return catalog.tags_of(recipe_id)
+        if key == "ingredients":
+            return catalog.ingredients_of(recipe_id)
+        if key == "nutrition":
+            return dict(zip(NUTRIENTS, catalog.nutrition[recipe_id].tolist()))
+        return catalog.extras.get(recipe_id, {})[key]
+
+    def __iter__(self):
+        yield from self.KEYS
+        yield from self.catalog.extras.get(self.id, ())
+
+    def __len__(self):
+        return len(self.KEYS) + len(self.catalog.extras.get(self.id, ()))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    # Saved (plan cache, batch results) as a plain dict, not with the whole catalog
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+class _RecipeViews(Sequence):
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, recipe_id):
+        if isinstance(recipe_id, slice):
+            return [RecipeView(self.catalog, i) for i in range(len(self.catalog))[recipe_id]]
+        if not -len(self.catalog) <= recipe_id < len(self.catalog):
+            raise IndexError(recipe_id)
+        return RecipeView(self.catalog, recipe_id % len(self.catalog))
+
+    def __len__(self):
+        return len(self.catalog)
+
+# RecipeCatalog stored as columns instead of one dict per recipe: nutrition is a
+# recipes x NUTRIENTS float array, tags, ingredient names and units are stored once
+# and referred to by id, and each recipe's tags and ingredients are runs in flat id
+# and quantity arrays (CSR style, one count per recipe). That is a few hundred bytes
+# a recipe instead of several kilobytes of dicts and strings. Recipes come back as
+# RecipeView mappings; keys other than name/tags/ingredients/nutrition are kept as is.
+class CompactRecipeCatalog(RecipeCatalog):
+    # Column name -> numpy dtype. New recipes are appended to array.array buffers and
+    # moved into the numpy columns the next time the columns are read
+    COLUMNS = {
+        'nutrition': 'd',          # NUTRIENTS values per recipe, flattened
+        'tag_counts': 'i',         # recipe id -> number of tags
+        'tag_ids': 'i',            # tag ids, recipe after recipe
+        'ingredient_counts': 'i',  # recipe id -> number of ingredients
+        'ingredient_ids': 'i',     # ingredient name ids, recipe after recipe
+        'unit_ids': 'i',           # unit ids lined up with ingredient_ids, -1 when missing
+        'quantities': 'd',         # quantities lined up with ingredient_ids
+    }
+
+    def __init__(self, recipes=()):
+        self.names = []              # recipe id -> name
+        self.ids_by_name = {}        # recipe name -> first recipe id with it
+        self.tag_names = []          # tag id -> tag
+        self.ingredient_names = []   # ingredient id -> ingredient name
+        self.unit_names = []         # unit id -> unit
+        self.extras = {}             # recipe id -> keys beyond the standard four, if any
+        self._string_ids = {'tag': {}, 'ingredient': {}, 'unit': {}}
+        self._pending = {name: array(typecode) for name, typecode in self.COLUMNS.items()}
+        self._columns = {name: np.zeros(0, dtype=typecode) for name, typecode in self.COLUMNS.items()}
+        self._offsets = {}
+        self._ingredient_matrix = None
+        self._content_version = None
+        self.source = None
+        self.source_version = None
+        for recipe in recipes:
+            self.add(recipe)
+
+    @classmethod
+    def from_file(cls, filename: str, use_cache=True):
+        catalog = load_compact_catalog(filename, use_cache)
+        catalog.source = filename
+        return catalog
+
+    def _string_id(self, kind, names, value):
+        ids = self._string_ids[kind]
+        string_id = ids.get(value)
+        if string_id is None:
+            string_id = ids[value] = len(names)
+            names.append(sys.intern(value))
+        return string_id
+
+    def add(self, recipe):
+        if not _is_catalog_entry(recipe):
+            return None
+        recipe_id = len(self.names)
+        pending = self._pending
+        self.names.append(recipe["name"])
+        self.ids_by_name.setdefault(recipe["name"], recipe_id)
+
+        nutrition = recipe.get("nutrition") or {}
+        pending['nutrition'].extend(float(nutrition.get(key, 0)) for key in NUTRIENTS)
+
+        tags = recipe.get("tags")
+        tags = [tag for tag in tags if isinstance(tag, str)] if isinstance(tags, list) else []
+        pending['tag_counts'].append(len(tags))
+        pending['tag_ids'].extend(self._string_id('tag', self.tag_names, tag) for tag in tags)
+
+        ingredients = recipe.get("ingredients", [])
+        pending['ingredient_counts'].append(len(ingredients))
+        for ingredient in ingredients:
+            pending['ingredient_ids'].append(self._string_id('ingredient', self.ingredient_names, ingredient["ingredient"]))
+            unit = ingredient.get("unit")
+            pending['unit_ids'].append(-1 if unit is None else self._string_id('unit', self.unit_names, unit))
+            pending['quantities'].append(ingredient["quantity"])
+
+        extras = {key: value for key, value in recipe.items() if key not in RecipeView.KEYS}
+        if extras:
+            self.extras[recipe_id] = extras
+        self._ingredient_matrix = None
+        self._content_version = None
+        self.source_version = None
+        return recipe_id
+
+    def column(self, name):
+        pending = self._pending[name]
+        if pending:
+            self._columns[name] = np.concatenate([self._columns[name], np.array(pending, dtype=pending.typecode)])
+            del pending[:]
+            self._offsets.clear()
+        return self._columns[name]
+
+    @property
+    def nutrition(self):
+        return self.column('nutrition').reshape(-1, len(NUTRIENTS))
+
+    # Where each recipe's run starts in the flat tag or ingredient arrays
+    def offsets(self, kind):
+        counts = self.column(f'{kind}_counts')
+        if kind not in self._offsets:
+            self._offsets[kind] = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        return self._offsets[kind]
+
+    def tags_of(self, recipe_id):
+        start, end = self.offsets('tag')[recipe_id:recipe_id + 2]
+        return [self.tag_names[i] for i in self.column('tag_ids')[start:end].tolist()]
+
+    def ingredients_of(self, recipe_id):
+        start, end = self.offsets('ingredient')[recipe_id:recipe_id + 2]
+        ingredients = []
+        for ingredient_id, unit_id, quantity in zip(self.column('ingredient_ids')[start:end].tolist(),
+                                                    self.column('unit_ids')[start:end].tolist(),
+                                                    self.column('quantities')[start:end].tolist()):
+            ingredient = {"ingredient": self.ingredient_names[ingredient_id], "quantity": quantity}
+            if unit_id >= 0:
+                ingredient["unit"] = self.unit_names[unit_id]
+            ingredients.append(ingredient)
+        return ingredients
+
+    def ingredient_counts(self):
+        return self.column('ingredient_counts')
+
+    @property
+    def recipes(self):
+        return _RecipeViews(self)
+
+    @property
+    def version(self):
+        if self.source_version is not None:
+            return self.source_version
+        if self._content_version is None:
+            digest = hashlib.sha256()
+            for strings in (self.names, self.tag_names, self.ingredient_names, self.unit_names):
+                digest.update(json.dumps(strings).encode())
+            for name in self.COLUMNS:
+                digest.update(self.column(name).tobytes())
+            digest.update(json.dumps(self.extras, sort_keys=True, default=str).encode())
+            self._content_version = digest.hexdigest()
+        return self._content_version
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (RecipeView(self, recipe_id) for recipe_id in range(len(self.names)))
+
+    def __contains__(self, name):
+        return name in self.ids_by_name
+
+    def get(self, name, default=None):
+        recipe_id = self.ids_by_name.get(name)
+        return default if recipe_id is None else RecipeView(self, recipe_id)
+
+    # Recipe id of every entry in a flat tag or ingredient array
+    def _rows(self, kind):
+        counts = self.column(f'{kind}_counts')
+        return np.repeat(np.arange(len(counts)), counts)
+
+    def ids_with_tags(self, *tags):
+        wanted = {tag.lower() for tag in tags}
+        tag_ids = [tag_id for tag_id, tag in enumerate(self.tag_names) if tag.lower() in wanted]
+        matches = np.isin(self.column('tag_ids'), tag_ids)
+        return set(np.unique(self._rows('tag')[matches]).tolist())
+
+    def ids_using_ingredient(self, ingredient):
+        wanted = ingredient.strip().lower()
+        ingredient_ids = [i for i, name in enumerate(self.ingredient_names) if name.strip().lower() == wanted]
+        matches = np.isin(self.column('ingredient_ids'), ingredient_ids)
+        return set(np.unique(self._rows('ingredient')[matches]).tolist())
+
+    def ingredient_matrix(self):
+        if self._ingredient_matrix is None:
+            self._ingredient_matrix = IngredientMatrix.from_compact(self)
+        return self._ingredient_matrix
+
+    # Pending buffers are folded in and the derived matrix is rebuilt after loading
+    def __getstate__(self):
+        for name in self.COLUMNS:
+            self.column(name)
+        state = dict(self.__dict__)
+        state['_ingredient_matrix'] = None
+        state['_offsets'] = {}
+        return state
+
+# The cache holds the catalog's plain state, so it loads no matter which module path
+# CompactRecipeCatalog was imported under
+def _read_compact_catalog(filename):
+    return CompactRecipeCatalog(iter_valid_recipes(_stream_recipes(filename))).__getstate__()
+
+# Streams the recipes file straight into a CompactRecipeCatalog (the full list of
+# recipe dicts is never built), through the compiled cache like load_recipes.
+# SQLite stores are read through MealPlannerStore like load_recipes does.
+@instrumented('load_recipes')
+def load_compact_catalog(filename: str, use_cache=True):
+    try:
+        if is_store_file(filename):
+            with MealPlannerStore(filename, create=False) as store:
+                catalog = CompactRecipeCatalog(iter_valid_recipes(store.load_recipes()))
+            print("Recipes loaded successfully.\n")  # Temporary print for validation
+            return catalog
+        catalog = CompactRecipeCatalog.__new__(CompactRecipeCatalog)
+        state, version = load_cached_version(filename, 'compact', _read_compact_catalog, use_cache)
+        catalog.__dict__.update(state)
+        catalog.source_version = version
+        print("Recipes loaded successfully.\n")  # Temporary print for validation
+        return catalog
+    except FileNotFoundError:
+        print("Error: recipes JSON file not found.")
+        return CompactRecipeCatalog()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        print("Error: Failed to decode JSON data.")
+        return CompactRecipeCatalog()
+
+# Sparse recipe x ingredient quantity matrix in CSR form (indptr/indices/data).
+# Columns are (ingredient, base unit) so "cup", "cups" and "tbsp" of the same
+# ingredient add up, and every quantity is stored in its column's base unit.
+class IngredientMatrix:
+    def __init__(self, recipes):
+        self.rows = {}           # recipe name -> row
+        self.columns = {}        # (ingredient name, base unit) -> column
+        self.column_keys = []    # column -> (ingredient name, base unit)
+        self.columns_by_name = {}  # ingredient name -> its columns, one per base unit
+        self.units = []          # unit id -> (unit as the recipe wrote it, base units in one of it)
+        self.unit_ids = {}       # (unit, factor) -> unit id
+        indptr, indices, data, entry_units = [0], [], [], []
+
+        for row, recipe in enumerate(recipes):
+            self.rows.setdefault(recipe["name"], row)
+            for ingredient in recipe.get("ingredients", []):
+                ingredient_name = ingredient["ingredient"].strip().lower()
+                unit = normalize_unit(ingredient.get("unit", "unit"))
+                base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+                key = (ingredient_name, base)
+                column = self.columns.get(key)
+                if column is None:
+                    column = self.columns[key] = len(self.column_keys)
+                    self.column_keys.append(key)
+                    self.columns_by_name.setdefault(ingredient_name, []).append(column)
+                indices.append(column)
+                data.append(ingredient["quantity"] * factor)
+                entry_units.append(self._unit_id(unit, factor))
+            indptr.append(len(indices))
+
+        self.entry_units = np.array(entry_units, dtype=np.int64)  # unit id of every nonzero
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=float)
+
+    # Same matrix straight from a CompactRecipeCatalog's columns: every distinct
+    # (ingredient, unit) pair is converted once instead of once per recipe
+    @classmethod
+    def from_compact(cls, catalog):
+        matrix = cls(())
+        for row, name in enumerate(catalog.names):
+            matrix.rows.setdefault(name, row)
+        ingredient_ids = catalog.column('ingredient_ids').astype(np.int64)
+        unit_ids = catalog.column('unit_ids').astype(np.int64)
+        pairs = ingredient_ids * (len(catalog.unit_names) + 1) + unit_ids + 1
+        unique_pairs, first_seen, inverse = np.unique(pairs, return_index=True, return_inverse=True)
+
+        # Columns are numbered in order of first use, like the recipe by recipe build
+        pair_columns = np.zeros(len(unique_pairs), dtype=np.int64)
+        pair_factors = np.zeros(len(unique_pairs))
+        pair_units = np.zeros(len(unique_pairs), dtype=np.int64)
+        for position in np.argsort(first_seen, kind='stable').tolist():
+            ingredient_id, unit_id = divmod(int(unique_pairs[position]), len(catalog.unit_names) + 1)
+            ingredient_name = catalog.ingredient_names[ingredient_id].strip().lower()
+            unit = normalize_unit(catalog.unit_names[unit_id - 1] if unit_id else "unit")
+            base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+            key = (ingredient_name, base)
+            column = matrix.columns.get(key)
+            if column is None:
+                column = matrix.columns[key] = len(matrix.column_keys)
+                matrix.column_keys.append(key)
+                matrix.columns_by_name.setdefault(ingredient_name, []).append(column)
+            pair_columns[position] = column
+            pair_factors[position] = factor
+            pair_units[position] = matrix._unit_id(unit, factor)
+
+        matrix.indptr = catalog.offsets('ingredient').astype(np.int64)
+        matrix.indices = pair_columns[inverse.reshape(-1)]
+        matrix.data = catalog.column('quantities') * pair_factors[inverse.reshape(-1)]
+        matrix.entry_units = pair_units[inverse.reshape(-1)]
+        return matrix
+
+    def _unit_id(self, unit, factor):
+        unit_id = self.unit_ids.get((unit, factor))
+        if unit_id is None:
+            unit_id = self.unit_ids[(unit, factor)] = len(self.units)
+            self.units.append((unit, factor))
+        return unit_id
+
+    # Column -> (unit shown on the shopping list, base units in one of it) for the
+    # columns the given recipes use. Mixed units show in the largest one those recipes
+    # use, e.g. cups over tablespoons, so recipes that aren't planned don't change it.
+    def display_units(self, recipe_names):
+        display = {}
+        for row in sorted({self.rows[name] for name in recipe_names if name in self.rows}):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            for column, unit_id in zip(self.indices[start:end].tolist(), self.entry_units[start:end].tolist()):
+                if column not in display or self.units[unit_id][1] > display[column][1]:
+                    display[column] = self.units[unit_id]
+        return display
+
+    # Base-unit quantities each plan needs. plans are {recipe name: times planned}
+    # dicts; returns the columns involved and a plans x columns array from a single
+    # product of the plans x recipes count matrix with the rows those plans use
+    def required(self, plans):
+        used_rows = sorted({self.rows[name] for plan in plans for name in plan if name in self.rows})
+        local_rows = {row: position for position, row in enumerate(used_rows)}
+        counts = np.zeros((len(plans), len(used_rows)))
+        for plan_index, plan in enumerate(plans):
+            for recipe_name, count in plan.items():
+                if recipe_name in self.rows:
+                    counts[plan_index, local_rows[self.rows[recipe_name]]] += count
+
+        # Pull the nonzeros of the used rows out of the CSR arrays
+        used_rows = np.array(used_rows, dtype=np.int64)
+        starts = self.indptr[used_rows]
+        lengths = self.indptr[used_rows + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+        row_positions = np.repeat(np.arange(len(used_rows)), lengths)
+        used_columns, column_positions = np.unique(self.indices[positions], return_inverse=True)
+
+        quantities = np.zeros((len(used_rows), len(used_columns)))
+        np.add.at(quantities, (row_positions, column_positions), self.data[positions])
+        return used_columns, counts @ quantities
+
+    # What the pantry has of each column, in base units. Pantry rows whose unit can't be
+    # converted to the column's unit don't count, rows without a unit always do
+    def available(self, columns, available_ingredients):
+        stock = np.zeros(len(columns))
+        for position, column in enumerate(columns):
+            ingredient_name, base = self.column_keys[column]
+            item = available_ingredients.get(ingredient_name)
+            if not item:
+                continue
+            unit = normalize_unit(item.get('unit', ''))
+            item_base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+            if item_base == base or not unit:
+                stock[position] = item['quantity'] * factor
+        return stock
+
+    # Pantry stock for every column, in base units, looked up per pantry item so it
+    # costs the size of the pantry rather than the ingredient vocabulary
+    def stock(self, available_ingredients):
+        stock = np.zeros(len(self.column_keys))
+        for ingredient_name, item in available_ingredients.items():
+            for column, quantity in self.item_stock(ingredient_name, item):
+                stock[column] = quantity
+        return stock
+
+    # (column, base units) for one pantry item, nothing if no recipe uses it
+    def item_stock(self, ingredient_name, item):
+        columns = self.columns_by_name.get(ingredient_name.strip().lower())
+        if not columns or not item:
+            return []
+        unit = normalize_unit(item.get('unit', ''))
+        item_base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+        return [(column, item['quantity'] * factor) for column in columns
+                if self.column_keys[column][1] == item_base or not unit]
+
+    # Share of every recipe the pantry covers: each ingredient counts as the part of
+    # its quantity in stock (capped at 1), averaged over the recipe's ingredients.
+    # Recipes without ingredients are fully covered.
+    def coverage(self, available_ingredients):
+        stock = self.stock(available_ingredients)
+        covered = np.ones(len(self.data))
+        np.divide(stock[self.indices], self.data, out=covered, where=self.data > 0)
+        np.minimum(covered, 1, out=covered)
+        lengths = np.diff(self.indptr)
+        totals = np.bincount(np.repeat(np.arange(len(lengths)), lengths), weights=covered, minlength=len(lengths))
+        return np.where(lengths > 0, totals / np.maximum(lengths, 1), 1.0)
+
@@ -0,0 +1,662 @@
+import os
+import sys
+import json
+import csv
+import gc
+import hashlib
+import pickle
+import time
+from collections import Counter
+from collections.abc import Mapping
+import numpy as np
+
+from project import metrics
+from project.metrics import instrumented
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+NUTRIENTS = ["calories", "protein", "carbs", "fat", "fiber"]
+# Keys every recipe has, anything else a recipe carries is kept as extra data
+RECIPE_KEYS = ("name", "tags", "ingredients", "nutrition")
+
+
+# Compiled copies of the data files live in this folder next to the files themselves
+CACHE_DIR_NAME = '.meal_planner_cache'
+CACHE_FORMAT_VERSION = 3  # 2: pantry units are stripped, 3: pantry counters are cached
+
+# Compiled cache ---------
+# Each data file can be compiled to a pickle next to it. The cache header records the
+# source file's mtime, size and sha256: a matching mtime and size is trusted as-is, a
+# changed mtime with the same hash is re-stamped and reused, anything else is rebuilt.
+# Strings are interned before pickling so every repeated tag, unit and ingredient name
+# is stored once in the file and shared again after loading.
+def _cache_path(filename, kind):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, CACHE_DIR_NAME, f"{name}.{kind}.cache")
+
+def _file_sha256(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _intern_strings(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(key) if isinstance(key, str) else key: _intern_strings(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_intern_strings(item) for item in value]
+    return value
+
+# Unpickling builds every recipe dict at once, the garbage collector scanning them
+# all while that happens roughly doubles the load time
+def _unpickle(payload):
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(payload)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+def _write_cache(cache_filename, header, payload):
+    os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+    # Write next to the final name and swap it in so readers never see half a file
+    temporary_filename = f"{cache_filename}.{os.getpid()}.tmp"
+    with open(temporary_filename, 'wb') as file:
+        pickle.dump(header, file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.write(payload)
+    os.replace(temporary_filename, cache_filename)
+
+# Returns parse(filename), from the compiled cache when it's fresh
+def load_cached(filename, kind, parse, use_cache=True):
+    if not use_cache:
+        return parse(filename)
+    return load_cached_version(filename, kind, parse)[0]
+
+# Returns (parse(filename), sha256 of the file contents that were parsed). The hash is
+# taken together with the parse, and the file is read again if it changed meanwhile,
+# so the version always describes the data returned rather than the file as it is now
+def load_cached_version(filename, kind, parse, use_cache=True):
+    stat = os.stat(filename)  # Missing source files raise FileNotFoundError like open() did
+    cache_filename = _cache_path(filename, kind)
+    header, payload = {}, None
+    if use_cache:
+        try:
+            with open(cache_filename, 'rb') as file:
+                header = pickle.load(file)
+                payload = file.read()
+        except (OSError, EOFError, pickle.UnpicklingError):
+            header, payload = {}, None
+
+    fresh = isinstance(header, dict) and header.get('format') == CACHE_FORMAT_VERSION
+    if fresh and (header.get('mtime_ns'), header.get('size')) == (stat.st_mtime_ns, stat.st_size):
+        if metrics.active is not None:
+            metrics.active.count(f'load_cached.{kind}.hit')
+        return _unpickle(payload), header.get('sha256')
+    if metrics.active is not None and use_cache:
+        metrics.active.count(f'load_cached.{kind}.miss')
+
+    while True:
+        sha256 = _file_sha256(filename)
+        if fresh and header.get('sha256') == sha256:
+            # Only the timestamp changed, keep the compiled data and refresh the header
+            data = _unpickle(payload)
+        else:
+            data = _intern_strings(parse(filename)) if use_cache else parse(filename)
+            payload = None
+        changed = os.stat(filename)
+        if (changed.st_mtime_ns, changed.st_size) == (stat.st_mtime_ns, stat.st_size):
+            break
+        stat = changed  # Rewritten while it was read, read it again
+    if not use_cache:
+        return data, sha256
+
+    if payload is None:
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    header = {'format': CACHE_FORMAT_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': sha256}
+    try:
+        _write_cache(cache_filename, header, payload)
+    except OSError as e:
+        print(f"Warning: could not write cache for {filename}: {e}")
+    return data, sha256
+
+def _read_json(filename):
+    with open(filename, mode='r') as file:
+        return json.load(file)
+
+# SQLite stores (project.store) are told apart by their extension. The store imports
+# files through this module, so MealPlannerStore is imported where a store is read
+STORE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+def is_store_file(filename):
+    return isinstance(filename, str) and filename.lower().endswith(STORE_EXTENSIONS)
+
+# load in preferences file
+#MADDIE----
+@instrumented('load_preferences')
+def load_preferences(filename: str, use_cache=True):
+    try:
+        if is_store_file(filename):
+            from project.store import MealPlannerStore
+            with MealPlannerStore(filename, create=False) as store:
+                preferences = store.load_preferences()
+        else:
+            preferences = load_cached(filename, 'preferences', _read_json, use_cache)
+        print("Preferences loaded successfully.\n")  # Temporary print for validation
+        return preferences
+    except FileNotFoundError:
+        print("Error: JSON file not found.")
+        return {}
+    except json.JSONDecodeError:
+        print("Error: Failed to decode JSON data.")
+        return {}
+
+# load in recipes file
+def load_recipes(filename: str, use_cache=True):
+    return _load_recipes(filename, use_cache)[0]
+
+# The recipes and the sha256 of the file they were parsed from (None for a store)
+@instrumented('load_recipes')
+def _load_recipes(filename, use_cache=True):
+    try:
+        version = None
+        if is_store_file(filename):
+            from project.store import MealPlannerStore
+            with MealPlannerStore(filename, create=False) as store:
+                recipes_data = {'recipes': store.load_recipes()}
+        else:
+            recipes_data, version = load_cached_version(filename, 'recipes', _read_json, use_cache)
+        print("Recipes loaded successfully.\n")  # Temporary print for validation
+        return recipes_data['recipes'], version
+    except FileNotFoundError:
+        print("Error: recipes JSON file not found.")
+        return {}, None
+    except json.JSONDecodeError:
+        print("Error: Failed to decode JSON data.")
+        return {}, None
+
+# Walks a JSON document a chunk at a time for iter_recipes
+class _JSONChunkReader:
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.end_of_file = False
+        self.decoder = json.JSONDecoder()
+
+    # Reads the next chunk, dropping the text that was already consumed
+    def read_more(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.end_of_file = True
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    # Next non-whitespace character without consuming it, '' at the end of the file
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer) or not self.read_more():
+                return self.buffer[self.position:self.position + 1]
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f"Expecting one of {characters!r}", self.buffer, self.position)
+        self.position += 1
+        return character
+
+    # Decodes the next value, reading more of the file until it is complete
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number cut off by the chunk ("1." of "1.5") decodes early, so the value
+                # only counts once the character after it is in the buffer
+                if self.end_of_file or (end < len(self.buffer) and self.buffer[end] in ',:]} \t\r\n'):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.end_of_file:
+                    raise
+            self.read_more()
+
+def _stream_recipes(filename, chunk_size=1 << 16):
+    with open(filename, mode='r') as file:
+        reader = _JSONChunkReader(file, chunk_size)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.decode()
+            reader.expect(':')
+            if key != 'recipes':
+                reader.decode()  # Other top-level values are skipped
+            elif reader.expect('[') and reader.peek() == ']':
+                reader.position += 1
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.expect(',]') == ']':
+                        break
+            if reader.expect(',}') == '}':
+                return
+
+# Yields the recipes in the file's "recipes" array one at a time, so only the recipe
+# being decoded and one chunk of the file are in memory instead of the whole document
+def iter_recipes(filename: str, chunk_size=1 << 16):
+    try:
+        yield from _stream_recipes(filename, chunk_size)
+    except FileNotFoundError:
+        print("Error: recipes JSON file not found.")
+    except json.JSONDecodeError:
+        print("Error: Failed to decode JSON data.")
+
+# Shape check for one recipe, so streamed catalogs can drop bad entries as they go
+def is_valid_recipe(recipe):
+    # Mapping rather than dict so a CompactRecipeCatalog's read-only recipes pass too
+    if not isinstance(recipe, Mapping) or not isinstance(recipe.get("name"), str):
+        return False
+    if not isinstance(recipe.get("tags"), list) or not isinstance(recipe.get("ingredients"), list):
+        return False
+    for ingredient in recipe["ingredients"]:
+        if not isinstance(ingredient, Mapping) or not isinstance(ingredient.get("ingredient"), str):
+            return False
+        if not isinstance(ingredient.get("quantity"), (int, float)):
+            return False
+    nutrition = recipe.get("nutrition")
+    if not isinstance(nutrition, Mapping):
+        return False
+    return all(isinstance(nutrition.get(key), (int, float)) for key in NUTRIENTS)
+
+def iter_valid_recipes(recipes):
+    for recipe in recipes:
+        if is_valid_recipe(recipe):
+            yield recipe
+        else:
+            name = recipe.get("name", "unnamed") if isinstance(recipe, dict) else "unnamed"
+            print(f"Skipping invalid recipe '{name}'.")
+
+# load in ingredients file
+@instrumented('load_ingredients')
+def load_ingredients(filename: str, use_cache=True):
+    if is_store_file(filename):
+        from project.store import MealPlannerStore
+        with MealPlannerStore(filename, create=False) as store:
+            return store.load_ingredients()
+    compiled = load_cached(filename, 'ingredients', _compile_ingredients, use_cache)
+    if metrics.active is not None:
+        # Replayed on every load, so a cache hit reports the same bad rows as the run that parsed the file
+        for name, amount in compiled['counters'].items():
+            metrics.active.count(name, amount)
+    return compiled['ingredients']
+
+# The pantry and the counters reading it produced, cached together
+def _compile_ingredients(filename):
+    counters = Counter()
+    ingredients = _read_ingredients(filename, counters)
+    return {'ingredients': ingredients, 'counters': dict(counters)}
+
+# counters collects the load_ingredients counters, without it they go straight to the metrics
+def _read_ingredients(filename, counters=None):
+    report = counters is None
+    counters = Counter() if report else counters
+    ingredients = {}
+    
+    with open(filename, mode='r') as file:
+        reader = csv.DictReader(file)
+        
+        # Clean the fieldnames (headers) to remove any leading/trailing spaces
+        reader.fieldnames = [field.strip() for field in reader.fieldnames]
+        
+        for row in reader:
+            # Check if 'ingredient' exists in the row
+            ingredient_name = row.get('ingredient', '').strip().lower() if 'ingredient' in row else ''
+            
+            # Skip if the ingredient is missing
+            if not ingredient_name:
+                print("Skipping row due to missing ingredient.")
+                counters['load_ingredients.rows_skipped'] += 1
+                continue
+
+            # validation check for quantity, set quanitity to 0 if it is missing
+            quantity = row.get('quantity', None) 
+            if quantity is None or quantity == '': 
+                quantity = 0 
+
+            # Ensure that quantity is a valid number
+            try:
+                quantity = float(quantity)
+            except ValueError:
+                print(f"Warning: Invalid quantity '{quantity}' for ingredient '{ingredient_name}'. Setting it to 1.0.")
+                counters['load_ingredients.invalid_quantities'] += 1
+                quantity = 1.0  # Default to 1.0 if there's an invalid value
+
+            # Check if 'unit' exists, default to empty string if missing, and drop the
+            # space after the comma (" slice") like the headers
+            unit = (row.get('unit') or '').strip()
+            
+            ingredients[ingredient_name] = {
+                'quantity': quantity,
+                'unit': unit,
+            }
+
+    if report and metrics.active is not None:
+        for name, amount in counters.items():
+            metrics.active.count(name, amount)
+    return ingredients
+
+# Unit spellings that mean the same unit
+UNIT_ALIASES = {
+    'cups': 'cup', 'c': 'cup',
+    'tablespoon': 'tbsp', 'tablespoons': 'tbsp', 'tbs': 'tbsp',
+    'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'ounce': 'oz', 'ounces': 'oz',
+    'pound': 'lb', 'pounds': 'lb', 'lbs': 'lb',
+    'gram': 'g', 'grams': 'g', 'kilogram': 'kg', 'kilograms': 'kg',
+    'milliliter': 'ml', 'milliliters': 'ml', 'liter': 'l', 'liters': 'l',
+}
+
+# Units that convert into each other: unit -> (base unit, base units in one of it)
+UNIT_CONVERSIONS = {
+    'cup': ('cup', 1), 'tbsp': ('cup', 1 / 16), 'tsp': ('cup', 1 / 48),
+    'ml': ('cup', 1 / 236.588), 'l': ('cup', 1000 / 236.588),
+    'oz': ('oz', 1), 'lb': ('oz', 16), 'g': ('oz', 1 / 28.3495), 'kg': ('oz', 1000 / 28.3495),
+}
+
+# Abbreviations that don't take an 's' on the shopping list
+ABBREVIATED_UNITS = {'tbsp', 'tsp', 'ml', 'l', 'oz', 'lb', 'g', 'kg'}
+
+# One spelling per unit: " Cups" -> "cup", "ounces" -> "oz", "slices" -> "slice"
+def normalize_unit(unit):
+    unit = (unit or '').strip().lower()
+    unit = UNIT_ALIASES.get(unit, unit)
+    # Count units like slices or cloves
+    if unit not in UNIT_CONVERSIONS and len(unit) > 2 and unit.endswith('s') and not unit.endswith('ss'):
+        unit = unit[:-1]
+    return unit
+
+# Rounds away float noise from unit conversions and keeps whole numbers as ints
+def _tidy_quantity(quantity):
+    quantity = round(float(quantity), 3)
+    return int(quantity) if quantity.is_integer() else quantity
+
+# Bulk pantry loading --------
+# Warehouse inventory exports run to millions of rows with the same ingredient on many
+# of them. load_pantry_bulk reads them in chunks straight into columns, adds up the rows
+# of each ingredient in one unit and collects what was wrong with the file into a
+# PantryLoadReport instead of printing a line per bad row.
+
+PANTRY_ERROR_KINDS = {
+    'missing_ingredient': "no ingredient name",
+    'invalid_quantity': "quantity is not a number",
+    'negative_quantity': "quantity is below 0",
+    'unit_conflict': "unit can't be converted to the ingredient's other rows",
+}
+
+class PantryLoadReport:
+    def __init__(self, filename=None, max_examples=20):
+        self.filename = filename
+        self.max_examples = max_examples
+        self.rows = 0          # data rows read, blank lines not counted
+        self.loaded = 0        # rows that made it into the pantry
+        self.ingredients = 0   # distinct ingredients after merging
+        self.errors = Counter()
+        self.examples = []     # (row number, kind, detail) for the first few errors
+        self.seconds = 0.0
+
+    @property
+    def merged(self):
+        return self.loaded - self.ingredients
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def add_error(self, kind, row, detail, count=1):
+        self.errors[kind] += count
+        if metrics.active is not None:
+            metrics.active.count(f'load_pantry_bulk.{kind}', count)
+        if len(self.examples) < self.max_examples:
+            self.examples.append((row, kind, detail))
+
+    def to_json(self):
+        return {
+            'filename': self.filename,
+            'rows': self.rows,
+            'loaded': self.loaded,
+            'ingredients': self.ingredients,
+            'merged': self.merged,
+            'errors': dict(self.errors),
+            'examples': [{'row': row, 'kind': kind, 'detail': detail} for row, kind, detail in self.examples],
+            'seconds': round(self.seconds, 3),
+        }
+
+    def summary(self):
+        rate = self.rows / self.seconds if self.seconds else 0
+        lines = [f"{self.filename or 'pantry'}: {self.rows} rows, {self.loaded} loaded into "
+                 f"{self.ingredients} ingredients ({self.merged} duplicate rows merged) "
+                 f"in {self.seconds:.2f}s, {rate:,.0f} rows/s"]
+        for kind, count in sorted(self.errors.items()):
+            lines.append(f"  {count} skipped, {PANTRY_ERROR_KINDS.get(kind, kind)}")
+        for row, kind, detail in self.examples:
+            lines.append(f"  {'row ' + str(row) if row else 'merging'}: {detail}")
+        return "\n".join(lines)
+
+# Pantry held as columns: ingredient names, quantities and units lined up by position.
+# Reads like the {name: {'quantity', 'unit'}} dict load_ingredients returns, so it can
+# be passed anywhere a pantry is expected.
+class PantryInventory(Mapping):
+    def __init__(self, names, quantities, units, row_counts, report=None):
+        self.names = names                  # position -> ingredient name
+        self.quantities = quantities        # position -> quantity, numpy float array
+        self.units = units                  # position -> unit
+        self.row_counts = row_counts        # position -> rows merged into it
+        self.positions = {name: position for position, name in enumerate(names)}
+        self.report = report
+
+    def __getitem__(self, name):
+        position = self.positions[name]
+        return {'quantity': float(self.quantities[position]), 'unit': self.units[position]}
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def to_dict(self):
+        return {name: {'quantity': quantity, 'unit': unit}
+                for name, quantity, unit in zip(self.names, self.quantities.tolist(), self.units)}
+
+    # Writes the merged pantry back out in the ingredients.csv layout
+    def write_csv(self, output_filename):
+        with open(output_filename, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['ingredient', 'quantity', 'unit'])
+            writer.writerows((name, _tidy_quantity(quantity), unit)
+                             for name, quantity, unit in zip(self.names, self.quantities.tolist(), self.units))
+
+# Raw cell -> id dicts that only do the cleanup work the first time a spelling shows
+# up, so a million rows of a few thousand ingredients cost a dict lookup each
+class _PantryNames(dict):
+    def __init__(self):
+        super().__init__()
+        self.ids = {}    # cleaned name -> id
+        self.names = []  # id -> cleaned name
+
+    def __missing__(self, raw):
+        name = raw.strip().lower()
+        name_id = self.ids.get(name)
+        if name_id is None and name:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        self[raw] = -1 if name_id is None else name_id
+        return self[raw]
+
+class _PantryUnits(dict):
+    def __init__(self):
+        super().__init__()
+        self.ids = {}       # normalized unit -> id
+        self.units = []     # id -> normalized unit
+        self.bases = []     # id -> base unit, '' when the row had no unit
+        self.factors = []   # id -> base units in one of it
+
+    def __missing__(self, raw):
+        unit = normalize_unit(raw)
+        unit_id = self.ids.get(unit)
+        if unit_id is None:
+            unit_id = self.ids[unit] = len(self.units)
+            base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+            self.units.append(unit)
+            self.bases.append(base)
+            self.factors.append(factor)
+        self[raw] = unit_id
+        return unit_id
+
+# Reads the file a block of whole lines at a time and yields (first row number, rows
+# in the block, ingredient cells, quantity cells, unit cells, blank row positions).
+# Blocks without quotes where every line has the header's number of fields are cut up
+# with one str.split; anything else goes through the csv module.
+def _pantry_blocks(file, columns, field_count, chunk_size):
+    row_number = 1
+    while True:
+        text = file.read(chunk_size)
+        if not text:
+            return
+        if not text.endswith('\n'):
+            text += file.readline()
+        # Never end a block inside a quoted field
+        while text.count('"') % 2:
+            line = file.readline()
+            if not line:
+                break
+            text += line
+        lines = text.replace('\r\n', '\n').split('\n')
+        if lines[-1] == '':
+            lines.pop()
+
+        blank = ()
+        comma_counts = list(map(str.count, lines, [','] * len(lines)))
+        if '"' not in text and '' not in lines and comma_counts.count(field_count - 1) == len(lines):
+            row_count = len(lines)
+            cells = ','.join(lines).split(',')
+            picked = [cells[column::field_count] if column is not None else None for column in columns]
+        else:
+            rows = list(csv.reader(lines))
+            row_count = len(rows)
+            blank = {position for position, row in enumerate(rows) if not row}
+            picked = [[row[column] if len(row) > column else '' for row in rows] if column is not None else None
+                      for column in columns]
+        yield row_number, row_count, picked[0], picked[1], picked[2], blank
+        row_number += row_count
+
+# Quantity cells -> float array and a mask of the rows to keep. Blank cells count as 0
+# like load_ingredients; the cell by cell pass only runs for blocks numpy can't parse.
+def _pantry_quantities(cells, first_row, report):
+    try:
+        quantities = np.array(cells, dtype=float)
+    except ValueError:
+        quantities = np.zeros(len(cells))
+        for position, cell in enumerate(cells):
+            try:
+                quantities[position] = float(cell) if cell.strip() else 0.0
+            except ValueError:
+                quantities[position] = np.nan
+    keep = np.ones(len(cells), dtype=bool)
+    for position in np.flatnonzero(~np.isfinite(quantities) | (quantities < 0)).tolist():
+        kind = 'negative_quantity' if quantities[position] < 0 else 'invalid_quantity'
+        report.add_error(kind, first_row + position, f"{PANTRY_ERROR_KINDS[kind]}: {cells[position]!r}")
+        keep[position] = False
+    return quantities, keep
+
+# Fast validating loader for large pantry and inventory CSVs. Rows of the same
+# ingredient are added up in its base unit (2 lb and 8 oz of flour make 40 oz) and shown
+# in the largest unit used for it. Rows with no unit count in that unit too. Bad rows
+# are skipped and counted in the returned PantryInventory's report.
+@instrumented('load_pantry_bulk')
+def load_pantry_bulk(filename: str, chunk_size=1 << 20, max_examples=20):
+    started = time.perf_counter()
+    report = PantryLoadReport(filename, max_examples)
+    names, units = _PantryNames(), _PantryUnits()
+    pair_codes, pair_sums, pair_rows = [], [], []
+
+    with open(filename, mode='r', newline='', encoding='utf-8-sig') as file:
+        header = [field.strip().lower() for field in next(csv.reader([file.readline()]), [])]
+        if 'ingredient' not in header:
+            raise ValueError(f"{filename} has no 'ingredient' column")
+        columns = [header.index(field) if field in header else None for field in ('ingredient', 'quantity', 'unit')]
+
+        for first_row, row_count, name_cells, quantity_cells, unit_cells, blank in \
+                _pantry_blocks(file, columns, len(header), chunk_size):
+            report.rows += row_count - len(blank)
+            name_ids = np.fromiter(map(names.__getitem__, name_cells), np.int64, row_count)
+            if quantity_cells is None:
+                quantities, keep = np.zeros(row_count), np.ones(row_count, dtype=bool)
+            else:
+                quantities, keep = _pantry_quantities(quantity_cells, first_row, report)
+            unit_ids = np.fromiter(map(units.__getitem__, unit_cells or [''] * row_count), np.int64, row_count)
+
+            missing = np.flatnonzero(name_ids < 0).tolist()
+            for position in missing:
+                if position not in blank:
+                    report.add_error('missing_ingredient', first_row + position, PANTRY_ERROR_KINDS['missing_ingredient'])
+            keep[missing] = False
+
+            # One partial sum per (ingredient, unit) in the block, combined after the last block
+            codes, inverse, counts = np.unique((name_ids[keep] << 32) | unit_ids[keep],
+                                               return_inverse=True, return_counts=True)
+            pair_codes.append(codes)
+            pair_sums.append(np.bincount(inverse.reshape(-1), weights=quantities[keep], minlength=len(codes)))
+            pair_rows.append(counts)
+
+    codes, inverse = np.unique(np.concatenate(pair_codes) if pair_codes else np.zeros(0, np.int64), return_inverse=True)
+    sums = np.bincount(inverse.reshape(-1), weights=np.concatenate(pair_sums) if pair_sums else None, minlength=len(codes))
+    rows = np.bincount(inverse.reshape(-1), weights=np.concatenate(pair_rows) if pair_rows else None, minlength=len(codes))
+
+    # Settle each ingredient's unit: the base unit most of its rows use, shown in the
+    # largest unit of that base. This loops over distinct (ingredient, unit) pairs, not rows.
+    by_name = {}
+    for code, total, row_count in zip(codes.tolist(), sums.tolist(), rows.tolist()):
+        by_name.setdefault(code >> 32, []).append((code & 0xFFFFFFFF, total, int(row_count)))
+    pantry_names, pantry_quantities, pantry_units, pantry_rows = [], [], [], []
+    for name_id, pairs in by_name.items():
+        base_rows = Counter()
+        for unit_id, total, row_count in pairs:
+            if units.bases[unit_id]:
+                base_rows[units.bases[unit_id]] += row_count
+        base = max(base_rows, key=base_rows.get) if base_rows else ''
+        display = max((unit_id for unit_id, _, _ in pairs if units.bases[unit_id] == base), key=units.factors.__getitem__)
+        display_unit, display_factor = units.units[display], units.factors[display]
+        quantity, loaded = 0.0, 0
+        for unit_id, total, row_count in pairs:
+            unit_base = units.bases[unit_id]
+            if not unit_base:
+                quantity += total
+            elif unit_base == base:
+                quantity += total * units.factors[unit_id] / display_factor
+            else:
+                report.add_error('unit_conflict', None, f"{names.names[name_id]}: {row_count} rows in "
+                                 f"'{units.units[unit_id]}' can't be added to '{display_unit}'", row_count)
+                continue
+            loaded += row_count
+        pantry_names.append(names.names[name_id])
+        pantry_quantities.append(quantity)
+        pantry_units.append(display_unit)
+        pantry_rows.append(loaded)
+
+    report.loaded = sum(pantry_rows)
+    report.ingredients = len(pantry_names)
+    report.seconds = time.perf_counter() - started
+    return PantryInventory(pantry_names, np.array(pantry_quantities, dtype=float), pantry_units,
+                           np.array(pantry_rows, dtype=np.int64), report)
+
@@ -1,77 +1,34 @@
+import os
 import sys
 import json
-import csv
-import random
-
-# load in preferences file
-#MADDIE----
-def load_preferences(filename: str):
-    try:
-        with open(filename, mode='r') as file:
-            preferences = json.load(file)
-        print("Preferences loaded successfully.\n")  # Temporary print for validation
-        return preferences
-    except FileNotFoundError:
-        print("Error: JSON file not found.")
-        return {}
-    except json.JSONDecodeError:
-        print("Error: Failed to decode JSON data.")
-        return {}
-
-# load in recipes file
-def load_recipes(filename: str):
-    try:
-        with open(filename, mode='r') as file:
-            recipes_data = json.load(file)
-        print("Recipes loaded successfully.\n")  # Temporary print for validation
-        return recipes_data['recipes']
-    except FileNotFoundError:
-        print("Error: recipes JSON file not found.")
-        return {}
-    except json.JSONDecodeError:
-        print("Error: Failed to decode JSON data.")
-        return {}
-
-# load in ingredients file
-def load_ingredients(filename: str):
-    ingredients = {}
-    
-    with open(filename, mode='r') as file:
-        reader = csv.DictReader(file)
-        
-        # Clean the fieldnames (headers) to remove any leading/trailing spaces
-        reader.fieldnames = [field.strip() for field in reader.fieldnames]
-        
-        for row in reader:
-            # Check if 'ingredient' exists in the row
-            ingredient_name = row.get('ingredient', '').strip().lower() if 'ingredient' in row else ''
-            
-            # Skip if the ingredient is missing
-            if not ingredient_name:
-                print("Skipping row due to missing ingredient.")
-                continue
-
-            # validation check for quantity, set quanitity to 0 if it is missing
-            quantity = row.get('quantity', None) 
-            if quantity is None or quantity == '': 
-                quantity = 0 
-
-            # Ensure that quantity is a valid number
-            try:
-                quantity = float(quantity)
-            except ValueError:
-                print(f"Warning: Invalid quantity '{quantity}' for ingredient '{ingredient_name}'. Setting it to 1.0.")
-                quantity = 1.0  # Default to 1.0 if there's an invalid value
-
-            # Check if 'unit' exists, default to empty string if missing
-            unit = row.get('unit', '')
-            
-            ingredients[ingredient_name] = {
-                'quantity': quantity,
-                'unit': unit,
-            }
-    
-    return ingredients
+import argparse
+import asyncio
+import functools
+
+# Run as a script (python main_menu.py) the folder above this one has to be on the
+# path for the project package to import
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The planner lives in the modules next to this one, everything they make public can
+# still be imported from here
+from project.metrics import PipelineMetrics, enable_metrics, disable_metrics, get_metrics, instrumented, profile_run
+from project.loaders import (DAYS, NUTRIENTS, RECIPE_KEYS, CACHE_DIR_NAME, CACHE_FORMAT_VERSION, load_cached,
+                             load_cached_version, STORE_EXTENSIONS, is_store_file, load_preferences, load_recipes,
+                             iter_recipes, is_valid_recipe, iter_valid_recipes, load_ingredients, UNIT_ALIASES,
+                             UNIT_CONVERSIONS, ABBREVIATED_UNITS, normalize_unit, PANTRY_ERROR_KINDS,
+                             PantryLoadReport, PantryInventory, load_pantry_bulk)
+from project.catalog import RecipeCatalog, RecipeView, CompactRecipeCatalog, load_compact_catalog, IngredientMatrix
+from project.store import STORE_SCHEMA_VERSION, STORE_SCHEMA, MealPlannerStore, import_store
+from project.planner import (filter_by_tags, recommend_recipes, rank_by_coverage, CALORIE_RANGE, MAX_ATTEMPTS,
+                             BEAM_WIDTH, MAX_MEALS_PER_DAY, EXACT_SEARCH_LIMIT, nutrition_matrix, plan_day_random,
+                             plan_day_optimize, PLANNING_ENGINES, MealPlan, plan_meals, create_meal_plan,
+                             IncrementalPlanner, MultiWeekPlan, DAY_POOL_SIZE, plan_weeks, parse_recipes,
+                             parse_meal_plan, build_shopping_lists, build_shopping_list, write_shopping_list,
+                             generate_shopping_list, plot_day_nutrition_totals, CHART_BACKGROUNDS,
+                             NutritionChartRenderer, render_nutrition_charts, PlanCache, cached_meal_plan,
+                             plan_profile, plan_batch, select_recipes)
+from project.service import ServiceBusy, PlanningService, PlanningClient
 
 #obligatory promts user and returns selected_diet
 def pick_preference(preferences):
@@ -96,42 +53,6 @@ def pick_preference(preferences):
         except ValueError:
             print("Invalid input. Please enter a number.")
             
-# XAVIER-----
-#function return preference
-def recommend_recipes(recipes, preferences):
-    # Create mapping full diet names and tags
-    diet_tag_mapping = {
-        "omnivore": "Omni",
-        "vegetarian": "Veg",
-        "pescatarian": "Pesc",
-        "vegan": "All"  # Vegan users will only see recipes tagged as "All"
-    }
-
-    # Get user-selected preference using the pick_preference function
-    selected_preference = preferences.get('selected_preference', None)
-    if not selected_preference:
-        print("No valid preference selected. Cannot recommend recipes.")
-        return []
-
-    # Extract the user's diet preference
-    diet_type = selected_preference.get("diet", "All").lower()
-    tag_to_match = diet_tag_mapping.get(diet_type, "All")
-
-    # Filter recipes based on diet preference
-    filtered_recipes = [
-        recipe for recipe in recipes
-        if isinstance(recipe, dict) and "tags" in recipe and isinstance(recipe["tags"], list) and (
-            tag_to_match.lower() in [tag.lower() for tag in recipe["tags"]] or "all" in [tag.lower() for tag in recipe["tags"]]
-        )
-    ]
-    
-    # Sorting by the number of ingredients making shopping/picking easier
-    sorted_recipes = sorted(filtered_recipes, key=lambda r: len(r["ingredients"]))
-    
-    print(f"\nRecommended recipes for the {diet_type} diet (including recipes tagged 'All'):\n")
-    
-    return sorted_recipes
-
 #used in meal_plan
 def pick_from_sorted(recipes, preferences):
     if not recipes:
@@ -209,218 +130,225 @@ def pick_from_sorted(recipes, preferences):
 
     return selected_recipes
 
-def create_meal_plan(selected_recipes, selected_diet, output_filename='meal_plan.txt'):
-    # Daily calorie limit from the selected diet with a ±200 range
-    calorie_limit = selected_diet["nutritional_goals"]["calories"]
-    lower_calorie_limit = calorie_limit - 200
-    upper_calorie_limit = calorie_limit + 200
-
-    # 7-day meal plan
-    meal_plan = {day: [] for day in ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]}
-    day_nutrition_totals = {day: {"calories": 0, "protein": 0, "carbs": 0, "fat": 0, "fiber": 0} for day in meal_plan}
-
-    # List of available recipes
-    recipes = {recipe["name"]: recipe["nutrition"] for recipe in selected_recipes}
-
-    # Protects from infinite loop
-    MAX_ATTEMPTS = 100
-
-    # Meal plan random no repeats for each day
-    for day in meal_plan.keys():
-        used_recipes = set()  # Track used recipes for the day
-        attempt_count = 0  # Reset the attempt count for each day
-        print(f"Creating meal plan for {day}.")
-
-        while day_nutrition_totals[day]["calories"] < lower_calorie_limit or (
-            day_nutrition_totals[day]["calories"] < upper_calorie_limit
-        ):
-            if attempt_count >= MAX_ATTEMPTS:
-                print(f"Max attempts to fill {day}'s meal plan. Consider adding more recipes.")
-                break
-            recipe = random.choice(selected_recipes)  # Randomly select a recipe
-            attempt_count += 1
-
-            # Check if recipe already used for the day
-            if recipe["name"] not in used_recipes:
-                # Check if adding the recipe would keep within the upper calorie limit
-                if day_nutrition_totals[day]["calories"] + recipe["nutrition"]["calories"] <= upper_calorie_limit:
-                    # Add recipe to the current day
-                    meal_plan[day].append(recipe["name"])
-                    used_recipes.add(recipe["name"])  # Mark recipe as used
-
-                    # Update nutritional totals for the day
-                    for key in day_nutrition_totals[day]:
-                        day_nutrition_totals[day][key] += recipe["nutrition"][key]
-                else:
-                    break  # Stop adding if the upper calorie limit would be exceeded
-
-    # Write meal plan to meal_plan.txt
-    with open(output_filename, 'w') as file:
-        for day, recipes in meal_plan.items():
-            file.write(f"\n{day}:\n")
-            if recipes:
-                for recipe_name in recipes:
-                    file.write(f"  - {recipe_name}\n")
-                file.write("Total Nutritional Values for the day:\n")
-                file.write(f"  Calories: {round(day_nutrition_totals[day]['calories'], 1)} kcal\n")
-                file.write(f"  Protein: {round(day_nutrition_totals[day]['protein'], 1)} g\n")
-                file.write(f"  Carbs: {round(day_nutrition_totals[day]['carbs'], 1)} g\n")
-                file.write(f"  Fat: {round(day_nutrition_totals[day]['fat'], 1)} g\n")
-                file.write(f"  Fiber: {round(day_nutrition_totals[day]['fiber'], 1)} g\n")
-            else:
-                file.write("  No recipes available for this day.\n")
-
-    print(f"Meal plan has been written to {output_filename}")
-    return day_nutrition_totals
-#MADDIE--------
-# go through recipes
-def parse_recipes(recipes_file):
+# The whole pipeline without prompts. The meal plan is written as text with the
+# shopping list appended (like main()), or as one JSON document when output_filename
+# ends in .json. plot_filename saves the nutrition chart.
+def run_headless(diet, recipes_file='recipes.json', preferences_file='preferences.json',
+                 ingredients_file='ingredients.csv', include=None, exclude=None, engine='optimize', seed=None,
+                 output_filename='meal_plan.txt', plot_filename=None):
+    preferences = load_preferences(preferences_file)
+    selected_diet = next((pref for pref in preferences.get("user_preferences", [])
+                          if pref["diet"].lower() == diet.lower()), None)
+    if selected_diet is None:
+        available_diets = ", ".join(pref["diet"] for pref in preferences.get("user_preferences", []))
+        raise ValueError(f"Unknown diet '{diet}'. Available diets: {available_diets}")
+
+    available_ingredients = load_ingredients(ingredients_file)
+    if is_store_file(recipes_file):
+        # Diet filtering and --include lookups run as queries on the database
+        with MealPlannerStore(recipes_file, create=False) as store:
+            recommended_recipes = recommend_recipes(store, {'selected_preference': selected_diet}, available_ingredients)
+            selected_recipes = select_recipes(recommended_recipes, store, include, exclude)
+        recipes = None  # The plan carries its recipes, the shopping list doesn't need the store
+    else:
+        recipes = RecipeCatalog.from_file(recipes_file)
+        recommended_recipes = recommend_recipes(recipes, {'selected_preference': selected_diet}, available_ingredients)
+        selected_recipes = select_recipes(recommended_recipes, recipes, include, exclude)
+
+    meal_plan = create_meal_plan(selected_recipes, selected_diet, None, engine, seed)
+    shopping_list = generate_shopping_list(meal_plan, recipes, available_ingredients, None)
+    if output_filename.endswith('.json'):
+        result = {'diet': selected_diet['diet']}
+        result.update(meal_plan.to_json())
+        result['shopping_list'] = shopping_list
+        with open(output_filename, 'w') as file:
+            json.dump(result, file, indent=2)
+        print(f"Meal plan has been written to {output_filename}")
+    else:
+        meal_plan.write_text(output_filename)
+        write_shopping_list(shopping_list, output_filename)
+
+    if plot_filename is not None:
+        plot_day_nutrition_totals(meal_plan, plot_filename)
+    return meal_plan, shopping_list
+
+def plan_main(args):
     try:
-        with open(recipes_file, 'r') as file:
-            data = json.load(file)
-        # Recipes are in the 'recipes' list, contain 'name', 'ingredients', and 'quantity'
-        recipes = {recipe['name']: {ingredient['ingredient']: ingredient['quantity'] for ingredient in recipe['ingredients']} for recipe in data['recipes']}
-        return recipes
-    except Exception as e:
-        print(f"Error reading recipes file: {e}")
-        return {}  
-
-# recipes were printing with "-", this fixes that
-def parse_meal_plan(meal_plan_file):
-    meal_plan = {}
-    
-    with open(meal_plan_file, 'r') as file:
-        for line in file:
-            # Remove leading/trailing spaces and skip empty lines
-            line = line.strip()
-            if not line:
-                continue
-
-            # Check if the line starts with "- ", removes
-            if line.startswith('-'):
-                recipe_name = line[1:].strip()
-                # counts occurences
-                if recipe_name in meal_plan:
-                    meal_plan[recipe_name] += 1
-                else:
-                    meal_plan[recipe_name] = 1
-    
-    return meal_plan
-
-
-def generate_shopping_list(meal_plan_file, recipes_file, ingredient_file, output_filename='meal_plan.txt'):
-    # Load recipes from the JSON file and user_available ingredients from CSV file
-    recipes = load_recipes(recipes_file)
-    available_ingredients = load_ingredients(ingredient_file)
-
-    meal_plan = parse_meal_plan(meal_plan_file)
-
-    shopping_list = {}
-
-    # Aggregate ingredient quantities for each recipe in the meal plan
-    for recipe_name, count in meal_plan.items():
-        # Find the recipe in the recipes data
-        recipe = next((r for r in recipes if r["name"] == recipe_name), None)
-
-        if recipe:
-            ingredients = recipe["ingredients"]
-
-            for ingredient in ingredients:
-                ingredient_name = ingredient["ingredient"].strip().lower()
-                required_quantity = ingredient["quantity"] * count  # Total quantity required for the meal plan
-                unit = ingredient.get("unit", "unit")  # Extract unit from the recipe ingredient data
-
-                # Checks if the ingredient is in the ingredients CSV
-                if ingredient_name in available_ingredients:
-                    available_quantity = available_ingredients[ingredient_name]['quantity']
-                else:
-                    available_quantity = 0
-
-                # Subtracts total needed ingredients in recipes with the ingredients the user has
-                remaining_quantity = max(0, required_quantity - available_quantity)
-
-                if remaining_quantity > 0:
-                    if ingredient_name in shopping_list:
-                        shopping_list[ingredient_name]['quantity'] += remaining_quantity
-                    else:
-                        shopping_list[ingredient_name] = {
-                            'quantity': remaining_quantity,
-                            'unit': unit
-                        }
-
-    # Write the shopping list to meal_plan.txt
+        run_headless(args.diet, args.recipes, args.preferences, args.ingredients, args.include, args.exclude,
+                     args.engine, args.seed, args.output, args.plot)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+# Compiles the data files up front so the next run starts from the cache
+def compile_cache(recipes_file='recipes.json', preferences_file='preferences.json', ingredients_file='ingredients.csv'):
+    load_recipes(recipes_file)
+    load_preferences(preferences_file)
+    load_ingredients(ingredients_file)
+
+def import_main(args):
+    import_store(args.store, args.recipes, args.ingredients, args.preferences)
+
+def pantry_main(args):
     try:
-        with open(output_filename, 'a') as file:
-            file.write("\nShopping List:\n")
-            for ingredient, details in shopping_list.items():
-                unit = details['unit']
-                total_quantity = details['quantity']
-
-                if total_quantity > 1 and not unit.endswith('s'):
-                    unit += 's'
-                    
-                file.write(f"{ingredient}: {total_quantity} {unit}\n")
-
-        print(f"Shopping list has been successfully appended to {output_filename}.")
-    except Exception as e:
-        print(f"Error appending shopping list: {e}")
-#XAVIER-------
-# Import "matplotlib.pyplot"
-import matplotlib.pyplot as plt
-
-def plot_day_nutrition_totals(day_nutrition_totals):
-    # Prepare data for plotting
-    days = list(day_nutrition_totals.keys())
-    calories = [day_nutrition_totals[day]['calories'] for day in days]
-    protein = [day_nutrition_totals[day]['protein'] for day in days]
-    carbs = [day_nutrition_totals[day]['carbs'] for day in days]
-    fat = [day_nutrition_totals[day]['fat'] for day in days]
-    fiber = [day_nutrition_totals[day]['fiber'] for day in days]
-
-    #Plotting 
-    plt.figure(figsize=(10, 6))
-    
-    plt.bar(days, calories, label='Calories', color='red')
-    plt.bar(days, protein, bottom=calories, label='Protein', color='blue')
-    plt.bar(days, carbs, bottom=[calories[i] + protein[i] for i in range(len(days))], label='Carbs', color='green')
-    plt.bar(days, fat, bottom=[calories[i] + protein[i] + carbs[i] for i in range(len(days))], label='Fat', color='orange')
-    plt.bar(days, fiber, bottom=[calories[i] + protein[i] + carbs[i] + fat[i] for i in range(len(days))], label='Fiber', color='purple')
-    #Labels
-    plt.xlabel('Days of the Week')
-    plt.ylabel('Nutritional Values')
-    plt.title('Daily Nutrition Totals (Stacked Bar Graph)')
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.show()
+        pantry = load_pantry_bulk(args.ingredients, max_examples=args.examples)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(pantry.report.summary())
+    if args.output:
+        pantry.write_csv(args.output)
+        print(f"Merged pantry written to {args.output}")
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(pantry.report.to_json(), file, indent=2)
+
+def compile_main(args):
+    compile_cache(args.recipes, args.preferences, args.ingredients)
+
+def serve_main(args):
+    service = PlanningService(args.recipes, args.preferences, args.workers, args.max_pending, args.batch_size)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+def batch_main(args):
+    preferences = load_preferences(args.profiles)
+    catalog_class = CompactRecipeCatalog if args.compact else RecipeCatalog
+    recipes = catalog_class.from_file(args.recipes)
+    results = plan_batch(preferences.get('user_preferences', []), recipes,
+                         output_dir=args.output_dir, jsonl_filename=args.jsonl,
+                         workers=args.workers, engine=args.engine, seed=args.seed, cache_dir=args.cache_dir)
+    for result in results:
+        if 'error' in result:
+            print(f"Could not plan user {result['user_id']}: {result['error']}")
+
+# Charts for every plan in a JSONL file written by 'main_menu.py batch'
+def charts_main(args):
+    plans = {}
+    with open(args.plans) as file:
+        for line in file:
+            if line.strip():
+                result = json.loads(line)
+                # Users the batch couldn't plan have no chart
+                if 'error' not in result:
+                    plans[result['user_id']] = result['day_nutrition_totals']
+    render_nutrition_charts(plans, args.output_dir, args.format, args.workers)
+    print(f"Rendered {len(plans)} charts to {args.output_dir}")
 
 def main():
     #MADDIE-------
     # Load data files
     preferences = load_preferences('preferences.json')
-    recipes = load_recipes('recipes.json')
+    recipes = RecipeCatalog.from_file('recipes.json')
+    available_ingredients = load_ingredients('ingredients.csv')
 
     # User selects their preferred diet
     selected_diet = pick_preference(preferences)
     preferences['selected_preference'] = selected_diet
     #XAVIER------
-    # Recommend recipes based on user preference
-    recommended_recipes = recommend_recipes(recipes, preferences)
+    # Recommend recipes based on user preference, the ones the pantry covers most first
+    recommended_recipes = recommend_recipes(recipes, preferences, available_ingredients)
     
     # Allow the user to pick recipes for meal planning
     selected_recipes = pick_from_sorted(recommended_recipes, preferences)
     
-    #creates semi random meal plan with nutrition and selected diet in mind
-    day_nutrition_totals = create_meal_plan(selected_recipes, selected_diet)
+    #creates meal plan with nutrition and selected diet in mind
+    meal_plan = create_meal_plan(selected_recipes, selected_diet)
 
     #MADDIE----
-    #generates shopping list based on # of occurences of ingredient 
-    generate_shopping_list('meal_plan.txt', 'recipes.json', 'ingredients.csv')
+    #generates shopping list from the planned recipes, no re-reading meal_plan.txt, recipes.json or ingredients.csv
+    generate_shopping_list(meal_plan, recipes, available_ingredients)
 
     #XAVIER-----
     #uses matplot to plot the daily nutrients 
-    plot_day_nutrition_totals(day_nutrition_totals)
+    plot_day_nutrition_totals(meal_plan)
     
+# No arguments runs the interactive planner, subcommands run without prompts
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Smart Recipe Recommender and Meal Planner")
+    parser.add_argument('--metrics', help="write stage timings and planner counters to this JSON file")
+    parser.add_argument('--profile', help="write a cProfile capture of the run to this file")
+    subparsers = parser.add_subparsers(dest='command')
+
+    plan_parser = subparsers.add_parser('plan', help="plan one week without prompts")
+    plan_parser.add_argument('diet', help="diet name from preferences.json, e.g. vegan")
+    plan_parser.add_argument('--recipes', default='recipes.json')
+    plan_parser.add_argument('--preferences', default='preferences.json')
+    plan_parser.add_argument('--ingredients', default='ingredients.csv')
+    plan_parser.add_argument('--include', nargs='+', metavar='RECIPE', help="only plan with these recipes")
+    plan_parser.add_argument('--exclude', nargs='+', metavar='RECIPE', help="never plan these recipes")
+    plan_parser.add_argument('--engine', choices=sorted(PLANNING_ENGINES), default='optimize')
+    plan_parser.add_argument('--seed', type=int, default=None)
+    plan_parser.add_argument('--output', default='meal_plan.txt', help="meal plan and shopping list, .txt or .json")
+    plan_parser.add_argument('--plot', help="save the nutrition chart to this image file")
+    plan_parser.set_defaults(handler=plan_main)
+
+    batch_parser = subparsers.add_parser('batch', help="plan many preference profiles in parallel")
+    batch_parser.add_argument('profiles', help="JSON file shaped like preferences.json, entries may add 'user_id' and 'pantry'")
+    batch_parser.add_argument('--recipes', default='recipes.json')
+    output = batch_parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--output-dir', help="write one <user_id>.json file per profile")
+    output.add_argument('--jsonl', help="write every profile to one JSON lines file")
+    batch_parser.add_argument('--workers', type=int, default=None)
+    batch_parser.add_argument('--engine', choices=sorted(PLANNING_ENGINES), default='optimize')
+    batch_parser.add_argument('--seed', type=int, default=None)
+    batch_parser.add_argument('--cache-dir', help="reuse plans cached in this folder and add new ones")
+    batch_parser.add_argument('--compact', action='store_true', help="hold the recipes in columns, for very large catalogs")
+    batch_parser.set_defaults(handler=batch_main)
+
+    serve_parser = subparsers.add_parser('serve', help="answer planning requests over HTTP")
+    serve_parser.add_argument('--recipes', default='recipes.json')
+    serve_parser.add_argument('--preferences', default='preferences.json')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--unix', metavar='PATH', help="listen on this Unix socket instead")
+    serve_parser.add_argument('--workers', type=int, default=None, help="worker processes, 0 plans in threads")
+    serve_parser.add_argument('--max-pending', type=int, default=64, help="queued requests before answering 503")
+    serve_parser.add_argument('--batch-size', type=int, default=8)
+    serve_parser.set_defaults(handler=serve_main)
+
+    charts_parser = subparsers.add_parser('charts', help="render nutrition charts for batch results")
+    charts_parser.add_argument('plans', help="JSON lines file from 'batch --jsonl'")
+    charts_parser.add_argument('--output-dir', required=True)
+    charts_parser.add_argument('--format', choices=['png', 'svg', 'pdf'], default='png')
+    charts_parser.add_argument('--workers', type=int, default=1)
+    charts_parser.set_defaults(handler=charts_main)
+
+    import_parser = subparsers.add_parser('import', help="copy the data files into an SQLite store")
+    import_parser.add_argument('store', help="database file to create or refresh, e.g. planner.db")
+    import_parser.add_argument('--recipes', help="recipes JSON file")
+    import_parser.add_argument('--ingredients', help="pantry CSV file")
+    import_parser.add_argument('--preferences', help="preferences JSON file")
+    import_parser.set_defaults(handler=import_main)
+
+    pantry_parser = subparsers.add_parser('pantry', help="check and merge a large pantry or inventory CSV")
+    pantry_parser.add_argument('ingredients', help="CSV with ingredient, quantity and unit columns")
+    pantry_parser.add_argument('--output', help="write the merged pantry to this CSV file")
+    pantry_parser.add_argument('--report', help="write the validation report to this JSON file")
+    pantry_parser.add_argument('--examples', type=int, default=20, help="bad rows to list in the report")
+    pantry_parser.set_defaults(handler=pantry_main)
+
+    compile_parser = subparsers.add_parser('compile', help="build the fast-start cache for the data files")
+    compile_parser.add_argument('--recipes', default='recipes.json')
+    compile_parser.add_argument('--preferences', default='preferences.json')
+    compile_parser.add_argument('--ingredients', default='ingredients.csv')
+    compile_parser.set_defaults(handler=compile_main)
+
+    args = parser.parse_args(argv)
+    run = main if args.command is None else functools.partial(args.handler, args)
+    if args.metrics:
+        enable_metrics()
+    try:
+        if args.profile:
+            profile_run(run, output_filename=args.profile)
+        else:
+            run()
+    finally:
+        if args.metrics:
+            disable_metrics().write_json(args.metrics)
+
 if __name__ == "__main__":
-    main()
+    cli()
 
@@ -0,0 +1,105 @@
+import json
+import time
+import cProfile
+import pstats
+import functools
+from contextlib import contextmanager
+from collections import Counter
+
+# Instrumentation --------
+# Off by default: instrumented functions only check that metrics.active is None and
+# carry on. enable_metrics() starts recording stage wall times, counters (planner
+# attempts, rejection reasons, skipped pantry rows, ...) and values (catalog sizes), and
+# can forward every event to a callback(kind, name, value) for an external metrics system.
+class PipelineMetrics:
+    def __init__(self, callback=None):
+        self.stages = {}           # stage name -> {'calls', 'seconds', 'max_seconds'}
+        self.counters = Counter()  # event name -> count
+        self.values = {}           # measurement name -> last value
+        self.callback = callback
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+            if self.callback is not None:
+                self.callback('stage', name, seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+        if self.callback is not None:
+            self.callback('count', name, amount)
+
+    def record(self, name, value):
+        self.values[name] = value
+        if self.callback is not None:
+            self.callback('value', name, value)
+
+    def to_json(self):
+        return {'stages': self.stages, 'counters': dict(self.counters), 'values': self.values}
+
+    # Adds in what another process recorded (its to_json())
+    def merge(self, recorded):
+        for name, other in recorded['stages'].items():
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['calls'] += other['calls']
+            stage['seconds'] += other['seconds']
+            stage['max_seconds'] = max(stage['max_seconds'], other['max_seconds'])
+        self.counters.update(recorded['counters'])
+        self.values.update(recorded['values'])
+
+    def write_json(self, output_filename):
+        with open(output_filename, 'w') as file:
+            json.dump(self.to_json(), file, indent=2)
+
+# What is being recorded right now. The other modules read it as metrics.active at
+# call time, so they see enable_metrics() and disable_metrics() take effect
+active = None
+
+def enable_metrics(callback=None):
+    global active
+    active = PipelineMetrics(callback)
+    return active
+
+# Stops recording and returns what was recorded
+def disable_metrics():
+    global active
+    metrics, active = active, None
+    return metrics
+
+def get_metrics():
+    return active
+
+# Times every call of the decorated function as one stage while metrics are enabled
+def instrumented(stage_name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None:
+                return function(*args, **kwargs)
+            with active.stage(stage_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Runs function(*args, **kwargs) under cProfile and returns its result. The stats are
+# written to output_filename (open with pstats or snakeviz) or printed, top 25 by
+# cumulative time
+def profile_run(function, *args, output_filename=None, **kwargs):
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        if output_filename is not None:
+            profiler.dump_stats(output_filename)
+            print(f"Profile has been written to {output_filename}")
+        else:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+
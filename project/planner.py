@@ -0,0 +1,1161 @@
+import io
+import os
+import sys
+import json
+import random
+import hashlib
+import heapq
+import pickle
+from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from project import metrics
+from project.metrics import instrumented, enable_metrics, disable_metrics
+from project.loaders import DAYS, NUTRIENTS, ABBREVIATED_UNITS, _tidy_quantity, load_ingredients
+from project.catalog import RecipeCatalog, RecipeView, IngredientMatrix
+from project.store import MealPlannerStore
+
+# Recipes with any of the tags, lowercasing each recipe's tags once
+def filter_by_tags(recipes, *tags):
+    wanted = {tag.lower() for tag in tags}
+    for recipe in recipes:
+        if isinstance(recipe, Mapping) and isinstance(recipe.get("tags"), list):
+            if any(tag.lower() in wanted for tag in recipe["tags"]):
+                yield recipe
+
+# XAVIER-----
+#function return preference
+@instrumented('recommend_recipes')
+def recommend_recipes(recipes, preferences, available_ingredients=None, top_k=None):
+    # Create mapping full diet names and tags
+    diet_tag_mapping = {
+        "omnivore": "Omni",
+        "vegetarian": "Veg",
+        "pescatarian": "Pesc",
+        "vegan": "All"  # Vegan users will only see recipes tagged as "All"
+    }
+
+    # Get user-selected preference using the pick_preference function
+    selected_preference = preferences.get('selected_preference', None)
+    if not selected_preference:
+        print("No valid preference selected. Cannot recommend recipes.")
+        return []
+
+    # Extract the user's diet preference
+    diet_type = selected_preference.get("diet", "All").lower()
+    tag_to_match = diet_tag_mapping.get(diet_type, "All")
+
+    # Filter recipes based on diet preference, through the catalog's tag index when
+    # there is one, otherwise in one pass that only keeps the matching recipes
+    # (recipes can be a generator such as iter_recipes)
+    if isinstance(recipes, RecipeCatalog):
+        recipe_ids = sorted(recipes.ids_with_tags(tag_to_match, "all"))
+        filtered_recipes = [recipes.recipes[i] for i in recipe_ids]
+        sizes = recipes.ingredient_counts()[recipe_ids].tolist()
+    elif isinstance(recipes, MealPlannerStore):
+        # Only the matching recipes are read from the database
+        filtered_recipes = recipes.recipes_with_tags(tag_to_match, "all")
+        sizes = [len(recipe["ingredients"]) for recipe in filtered_recipes]
+    else:
+        filtered_recipes = list(filter_by_tags(recipes, tag_to_match, "all"))
+        sizes = [len(recipe["ingredients"]) for recipe in filtered_recipes]
+
+    if available_ingredients is not None:
+        # Recipes the pantry covers most come first, then the ones with fewer ingredients
+        if isinstance(recipes, RecipeCatalog):
+            coverage = recipes.ingredient_matrix().coverage(available_ingredients)[recipe_ids]
+        else:
+            coverage = IngredientMatrix(filtered_recipes).coverage(available_ingredients)
+        sorted_recipes = rank_by_coverage(filtered_recipes, coverage, top_k, sizes)
+    elif top_k is not None:
+        order = heapq.nsmallest(top_k, range(len(filtered_recipes)), key=sizes.__getitem__)
+        sorted_recipes = [filtered_recipes[i] for i in order]
+    else:
+        # Sorting by the number of ingredients making shopping/picking easier
+        order = sorted(range(len(filtered_recipes)), key=sizes.__getitem__)
+        sorted_recipes = [filtered_recipes[i] for i in order]
+    if metrics.active is not None:
+        if isinstance(recipes, RecipeCatalog):
+            metrics.active.record('recommend_recipes.catalog_size', len(recipes))
+        metrics.active.record('recommend_recipes.matched', len(sorted_recipes))
+    
+    print(f"\nRecommended recipes for the {diet_type} diet (including recipes tagged 'All'):\n")
+    
+    return sorted_recipes
+
+# Recipes by pantry coverage (one score per recipe, e.g. IngredientMatrix.coverage),
+# best first. Ties go to fewer ingredients (sizes, if the counts are already known)
+# and then the earlier recipe. With top_k only the best top_k are kept on a heap
+# instead of sorting every recipe.
+def rank_by_coverage(recipes, coverage, top_k=None, sizes=None):
+    coverage = np.asarray(coverage, dtype=float)
+    if sizes is None:
+        sizes = [len(recipe["ingredients"]) for recipe in recipes]
+    def rank(i):
+        return coverage[i], -sizes[i], -i
+    if top_k is None:
+        order = sorted(range(len(recipes)), key=rank, reverse=True)
+    else:
+        # Only recipes scoring at least the top_k-th best score can make the cut
+        candidates = range(len(recipes))
+        if 0 < top_k < len(recipes):
+            candidates = np.flatnonzero(coverage >= np.partition(coverage, -top_k)[-top_k]).tolist()
+        order = heapq.nlargest(top_k, candidates, key=rank)
+    return [recipes[i] for i in order]
+
+CALORIE_RANGE = 200
+
+# Protects the random engine from an infinite loop
+MAX_ATTEMPTS = 100
+# Partial day plans the optimizer keeps between rounds and most meals it will put in a day
+BEAM_WIDTH = 64
+MAX_MEALS_PER_DAY = 10
+# Up to this many candidate recipes every combination is scored (2^12 = 4096), so
+# the optimizer's day is the best one possible instead of the beam's approximation
+EXACT_SEARCH_LIMIT = 12
+
+# Recipes x nutrients matrix, one row per recipe in NUTRIENTS order
+def nutrition_matrix(recipes):
+    # Recipes from one CompactRecipeCatalog are rows of its nutrition array already
+    if recipes and all(isinstance(recipe, RecipeView) and recipe.catalog is recipes[0].catalog for recipe in recipes):
+        return recipes[0].catalog.nutrition[[recipe.id for recipe in recipes]]
+    matrix = np.zeros((len(recipes), len(NUTRIENTS)))
+    for row, recipe in enumerate(recipes):
+        matrix[row] = [recipe["nutrition"].get(key, 0) for key in NUTRIENTS]
+    return matrix
+
+# Planning engines pick one day's recipes. They get the nutrition matrix of the
+# candidate recipes, the goals vector, the calorie window and a seeded random.Random,
+# and return the row numbers of the recipes to use (no row twice)
+def plan_day_random(nutrition, goals, lower_calorie_limit, upper_calorie_limit, rng):
+    chosen = []
+    if not len(nutrition):
+        return chosen
+    calories = 0
+    attempt_count = 0
+    repeats = 0
+    while calories < upper_calorie_limit:
+        if attempt_count >= MAX_ATTEMPTS:
+            if metrics.active is not None:
+                metrics.active.count('plan_day_random.max_attempts_reached')
+            break
+        row = rng.randrange(len(nutrition))  # Randomly select a recipe
+        attempt_count += 1
+
+        # Check if recipe already used for the day
+        if row not in chosen:
+            # Check if adding the recipe would keep within the upper calorie limit
+            if calories + nutrition[row, 0] <= upper_calorie_limit:
+                chosen.append(row)
+                calories += nutrition[row, 0]
+            else:
+                if metrics.active is not None:
+                    metrics.active.count('plan_day_random.rejected_calorie_overshoot')
+                break  # Stop adding if the upper calorie limit would be exceeded
+        else:
+            repeats += 1
+
+    if metrics.active is not None:
+        metrics.active.count('plan_day_random.attempts', attempt_count)
+        metrics.active.count('plan_day_random.rejected_repeat', repeats)
+    return chosen
+
+# Beam search over recipe combinations. Every round extends each kept partial day by
+# every remaining recipe in one vectorized step, drops days over the calorie ceiling
+# and keeps the BEAM_WIDTH closest to the goals. The best day inside the calorie
+# window seen in any round wins. Pruning can drop the partial day the best one grows
+# from, so this is approximate; with EXACT_SEARCH_LIMIT or fewer candidates every
+# combination is scored instead and the result is optimal.
+def plan_day_optimize(nutrition, goals, lower_calorie_limit, upper_calorie_limit, rng):
+    return _optimize_day(nutrition, goals, lower_calorie_limit, upper_calorie_limit, rng)
+
+# plan_day_optimize's search. With a pool list, every kept branch that lands in the
+# calorie window is added to it as (score, rows) so later days can reuse them.
+def _optimize_day(nutrition, goals, lower_calorie_limit, upper_calorie_limit, rng, pool=None):
+    count = len(nutrition)
+    if count == 0:
+        return []
+
+    # Shuffled candidate order so the seed decides between equally good days
+    order = list(range(count))
+    rng.shuffle(order)
+    order = np.array(order)
+
+    # Distance is measured relative to each goal, goals that are missing or 0 are ignored
+    weights = np.divide(1.0, goals, out=np.zeros(len(goals)), where=goals > 0)
+    scaled = nutrition[order] * weights
+    target = goals * weights
+    recipe_calories = nutrition[order, 0]
+    if count <= EXACT_SEARCH_LIMIT:
+        return _exact_day(order, scaled, target, recipe_calories, lower_calorie_limit, upper_calorie_limit, pool)
+    recipe_norms = (scaled ** 2).sum(axis=1)
+    columns = np.arange(count)
+
+    totals = np.zeros((1, len(goals)))
+    calories = np.zeros(1)
+    last = np.full(1, -1)  # Recipes are added in increasing order so no combination repeats
+    picks = [()]
+    best_score, best_pick = np.inf, None
+    closest_score, closest_pick = np.inf, ()
+
+    for _ in range(MAX_MEALS_PER_DAY):
+        new_calories = calories[:, None] + recipe_calories[None, :]
+        unused = columns[None, :] > last[:, None]
+        valid = unused & (new_calories <= upper_calorie_limit)
+        if metrics.active is not None:
+            metrics.active.count('plan_day_optimize.rounds')
+            metrics.active.count('plan_day_optimize.branches_scored', int(valid.sum()))
+            metrics.active.count('plan_day_optimize.rejected_calorie_overshoot', int((unused & ~valid).sum()))
+        if not valid.any():
+            break
+        # |d + s|^2 = |d|^2 + 2 d.s + |s|^2, one matrix product for every branch x recipe pair
+        offsets = totals - target
+        scores = (offsets ** 2).sum(axis=1)[:, None] + 2 * offsets @ scaled.T + recipe_norms[None, :]
+        scores = np.where(valid, scores, np.inf)
+
+        in_window = np.where(valid & (new_calories >= lower_calorie_limit), scores, np.inf)
+        branch, column = np.unravel_index(np.argmin(in_window), in_window.shape)
+        if in_window[branch, column] < best_score:
+            best_score = in_window[branch, column]
+            best_pick = picks[branch] + (column,)
+
+        branch, column = np.unravel_index(np.argmin(scores), scores.shape)
+        if scores[branch, column] < closest_score:
+            closest_score = scores[branch, column]
+            closest_pick = picks[branch] + (column,)
+
+        keep = min(BEAM_WIDTH, int(valid.sum()))
+        flat = np.argpartition(scores.ravel(), keep - 1)[:keep]
+        branches, columns_kept = np.unravel_index(flat, scores.shape)
+        totals = totals[branches] + scaled[columns_kept]
+        calories = new_calories[branches, columns_kept]
+        last = columns_kept
+        picks = [picks[b] + (c,) for b, c in zip(branches, columns_kept)]
+        if pool is not None:
+            kept_scores = scores.ravel()[flat]
+            for branch in np.flatnonzero(calories >= lower_calorie_limit).tolist():
+                pool.append((float(kept_scores[branch]), tuple(int(order[column]) for column in picks[branch])))
+
+    # Nothing fits the calorie window, fall back to the closest underfilled day
+    if best_pick is None:
+        best_pick = closest_pick
+    return [int(order[column]) for column in best_pick]
+
+# Scores every combination of up to MAX_MEALS_PER_DAY of a few candidates at once, one
+# row per combination, and picks like the beam search does: the best day in the
+# calorie window, else the closest one under the ceiling
+def _exact_day(order, scaled, target, recipe_calories, lower_calorie_limit, upper_calorie_limit, pool=None):
+    count = len(order)
+    masks = ((np.arange(1, 1 << count)[:, None] >> np.arange(count)[None, :]) & 1).astype(float)
+    calories = masks @ recipe_calories
+    scores = ((masks @ scaled - target) ** 2).sum(axis=1)
+    fits = (masks.sum(axis=1) <= MAX_MEALS_PER_DAY) & (calories <= upper_calorie_limit)
+    in_window = fits & (calories >= lower_calorie_limit)
+    if metrics.active is not None:
+        metrics.active.count('plan_day_optimize.exact_searches')
+        metrics.active.count('plan_day_optimize.branches_scored', int(fits.sum()))
+
+    if pool is not None:
+        window_rows = np.flatnonzero(in_window)
+        for row in window_rows[np.argsort(scores[window_rows], kind='stable')][:DAY_POOL_SIZE].tolist():
+            pool.append((float(scores[row]), tuple(int(order[column]) for column in np.flatnonzero(masks[row]))))
+
+    candidates = np.flatnonzero(in_window if in_window.any() else fits)
+    if len(candidates) == 0:
+        return []
+    best = candidates[np.argmin(scores[candidates])]
+    return [int(order[column]) for column in np.flatnonzero(masks[best])]
+
+PLANNING_ENGINES = {
+    "random": plan_day_random,
+    "optimize": plan_day_optimize,
+}
+
+# Result of planning a week. It is still the day -> nutrition totals dict that
+# create_meal_plan always returned, and also carries the recipes picked for each
+# day so shopping lists and charts can be built from it without re-reading files
+class MealPlan(dict):
+    def __init__(self, days=DAYS):
+        super().__init__((day, {key: 0 for key in NUTRIENTS}) for day in days)
+        self.meals = {day: [] for day in days}  # day -> recipes, in the order they were picked
+
+    def clear_day(self, day):
+        self.meals[day] = []
+        self[day] = {key: 0 for key in NUTRIENTS}
+
+    def add(self, day, recipe):
+        self.meals[day].append(recipe)
+        # Update nutritional totals for the day
+        for key in self[day]:
+            self[day][key] += recipe["nutrition"][key]
+
+    @property
+    def day_nutrition_totals(self):
+        return dict(self)
+
+    def names(self, day):
+        return [recipe["name"] for recipe in self.meals[day]]
+
+    # {recipe name: times planned}, what parse_meal_plan reads back from meal_plan.txt
+    def counts(self):
+        return Counter(recipe["name"] for recipes in self.meals.values() for recipe in recipes)
+
+    # (recipe, times planned) pairs, so callers don't have to look recipes up again
+    def recipe_counts(self):
+        recipes = {}
+        for day_recipes in self.meals.values():
+            for recipe in day_recipes:
+                count = recipes.get(recipe["name"], (recipe, 0))[1]
+                recipes[recipe["name"]] = (recipe, count + 1)
+        return list(recipes.values())
+
+    def to_text(self):
+        lines = []
+        for day in self:
+            lines.append(f"\n{day}:")
+            if self.meals[day]:
+                for recipe_name in self.names(day):
+                    lines.append(f"  - {recipe_name}")
+                lines.append("Total Nutritional Values for the day:")
+                lines.append(f"  Calories: {round(self[day]['calories'], 1)} kcal")
+                lines.append(f"  Protein: {round(self[day]['protein'], 1)} g")
+                lines.append(f"  Carbs: {round(self[day]['carbs'], 1)} g")
+                lines.append(f"  Fat: {round(self[day]['fat'], 1)} g")
+                lines.append(f"  Fiber: {round(self[day]['fiber'], 1)} g")
+            else:
+                lines.append("  No recipes available for this day.")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {
+            'meal_plan': {day: self.names(day) for day in self},
+            'day_nutrition_totals': self.day_nutrition_totals,
+        }
+
+    def write_text(self, output_filename='meal_plan.txt'):
+        with open(output_filename, 'w') as file:
+            file.write(self.to_text())
+        print(f"Meal plan has been written to {output_filename}")
+
+    def write_json(self, output_filename):
+        with open(output_filename, 'w') as file:
+            json.dump(self.to_json(), file, indent=2)
+        print(f"Meal plan has been written to {output_filename}")
+
+# Engine, goals vector and calorie window planning for selected_diet uses
+def _planning_setup(selected_diet, engine):
+    if engine not in PLANNING_ENGINES:
+        raise ValueError(f"Unknown planning engine '{engine}'. Choose from: {', '.join(PLANNING_ENGINES)}")
+
+    # Daily calorie limit from the selected diet with a ±200 range
+    nutritional_goals = selected_diet["nutritional_goals"]
+    calorie_limit = nutritional_goals["calories"]
+    lower_calorie_limit = calorie_limit - CALORIE_RANGE
+    upper_calorie_limit = calorie_limit + CALORIE_RANGE
+    goals = np.array([nutritional_goals.get(key, 0) for key in NUTRIENTS], dtype=float)
+    return PLANNING_ENGINES[engine], goals, lower_calorie_limit, upper_calorie_limit
+
+# Plans each of days into meal_plan from recipes (nutrition lines up with them)
+def _fill_days(meal_plan, days, recipes, nutrition, plan_day, goals, lower_calorie_limit, upper_calorie_limit, rng):
+    for day in days:
+        print(f"Creating meal plan for {day}.")
+        if recipes:
+            rows = plan_day(nutrition, goals, lower_calorie_limit, upper_calorie_limit, rng)
+        else:
+            rows = []
+
+        for row in rows:
+            meal_plan.add(day, recipes[row])
+
+        if meal_plan[day]["calories"] < lower_calorie_limit:
+            print(f"Could not fill {day}'s meal plan to the calorie goal. Consider adding more recipes.")
+            if metrics.active is not None:
+                metrics.active.count('plan_meals.underfilled_days')
+
+# Picks the week's recipes in memory and returns them as a MealPlan
+@instrumented('plan_meals')
+def plan_meals(selected_recipes, selected_diet, engine='optimize', seed=None):
+    plan_day, goals, lower_calorie_limit, upper_calorie_limit = _planning_setup(selected_diet, engine)
+    rng = random.Random(seed)
+
+    # 7-day meal plan
+    meal_plan = MealPlan()
+
+    # List of available recipes, one entry per name so a day never repeats a recipe
+    recipes = list({recipe["name"]: recipe for recipe in selected_recipes}.values())
+    nutrition = nutrition_matrix(recipes)
+    if metrics.active is not None:
+        metrics.active.record('plan_meals.candidates', len(recipes))
+
+    _fill_days(meal_plan, list(meal_plan), recipes, nutrition, plan_day, goals, lower_calorie_limit, upper_calorie_limit, rng)
+    return meal_plan
+
+# Plans the week and writes it to output_filename (skipped when it is None). The
+# returned MealPlan can go straight into generate_shopping_list
+def create_meal_plan(selected_recipes, selected_diet, output_filename='meal_plan.txt', engine='optimize', seed=None):
+    meal_plan = plan_meals(selected_recipes, selected_diet, engine, seed)
+
+    # Write meal plan to meal_plan.txt
+    if output_filename is not None:
+        meal_plan.write_text(output_filename)
+    return meal_plan
+
+# Keeps a week's plan and its shopping list up to date as things change, instead of
+# re-running the whole pipeline. Per ingredient it remembers what the plan needs and
+# what the pantry holds (in base units), so a pantry change only recomputes the
+# lines for the ingredients that changed, and dropping a recipe re-plans only the
+# days that used it and updates the needs of the recipes those days swapped.
+class IncrementalPlanner:
+    def __init__(self, selected_recipes, selected_diet, available_ingredients, engine='optimize', seed=None):
+        self.plan_day, self.goals, self.lower_calorie_limit, self.upper_calorie_limit = _planning_setup(selected_diet, engine)
+        self.rng = random.Random(seed)
+        self.recipes = list({recipe["name"]: recipe for recipe in selected_recipes}.values())
+        self.nutrition = nutrition_matrix(self.recipes)
+        self.active = np.ones(len(self.recipes), dtype=bool)  # recipes that may still be planned
+        self.matrix = IngredientMatrix(self.recipes)
+
+        # Same plan create_meal_plan makes with this seed
+        self.meal_plan = MealPlan()
+        _fill_days(self.meal_plan, list(self.meal_plan), self.recipes, self.nutrition, self.plan_day,
+                   self.goals, self.lower_calorie_limit, self.upper_calorie_limit, self.rng)
+
+        self.available_ingredients = dict(available_ingredients)
+        self.stock = self.matrix.stock(self.available_ingredients)
+        self.required = np.zeros(len(self.matrix.column_keys))
+        for recipe, count in self.meal_plan.recipe_counts():
+            self._add_required(self.matrix.rows[recipe["name"]], count)
+        self.remaining = np.maximum(self.required - self.stock, 0)
+
+    # Adds count times recipe row's ingredients to what the plan needs, returns the columns
+    def _add_required(self, row, count):
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        columns = self.matrix.indices[start:end]
+        np.add.at(self.required, columns, count * self.matrix.data[start:end])
+        return columns.tolist()
+
+    # Recomputes the shopping-list lines of the given columns, returns the names of the
+    # ingredients whose line changed
+    def _refresh(self, columns):
+        changed = set()
+        for column in columns:
+            remaining = max(self.required[column] - self.stock[column], 0)
+            if abs(remaining - self.remaining[column]) > 1e-9:
+                changed.add(self.matrix.column_keys[column][0])
+            self.remaining[column] = remaining
+        if metrics.active is not None:
+            metrics.active.count('incremental.lines_recomputed', len(columns))
+        return sorted(changed)
+
+    @property
+    def shopping_list(self):
+        columns = np.flatnonzero(self.remaining > 1e-9)
+        planned = {name for day in self.meal_plan for name in self.meal_plan.names(day)}
+        return _shopping_list_lines(self.matrix, columns, self.remaining[columns], planned)
+
+    # Sets pantry items, {name: {'quantity', 'unit'}} or None for items that ran out.
+    # Returns the ingredients whose shopping-list line changed.
+    def update_pantry(self, changes):
+        columns = set()
+        for ingredient_name, item in changes.items():
+            ingredient_name = ingredient_name.strip().lower()
+            if item is None:
+                self.available_ingredients.pop(ingredient_name, None)
+            else:
+                self.available_ingredients[ingredient_name] = item
+            for column in self.matrix.columns_by_name.get(ingredient_name, []):
+                self.stock[column] = 0
+                columns.add(column)
+            for column, quantity in self.matrix.item_stock(ingredient_name, item):
+                self.stock[column] = quantity
+        return self._refresh(columns)
+
+    # Re-reads the pantry file and applies only the items that differ
+    def reload_pantry(self, filename):
+        pantry = load_ingredients(filename)
+        changes = {name: item for name, item in pantry.items() if self.available_ingredients.get(name) != item}
+        changes.update((name, None) for name in self.available_ingredients if name not in pantry)
+        return self.update_pantry(changes)
+
+    # Stops planning recipe_name and re-plans only the days it was on, the other days
+    # stay as they are. Returns the re-planned days.
+    def remove_recipe(self, recipe_name):
+        row = self.matrix.rows.get(recipe_name)
+        if row is None or not self.active[row]:
+            return []
+        self.active[row] = False
+        days = [day for day in self.meal_plan if recipe_name in self.meal_plan.names(day)]
+        if not days:
+            return []
+
+        counts = Counter()
+        for day in days:
+            counts.subtract(self.matrix.rows[name] for name in self.meal_plan.names(day))
+            self.meal_plan.clear_day(day)
+        rows = np.flatnonzero(self.active)
+        _fill_days(self.meal_plan, days, [self.recipes[i] for i in rows], self.nutrition[rows], self.plan_day,
+                   self.goals, self.lower_calorie_limit, self.upper_calorie_limit, self.rng)
+        for day in days:
+            counts.update(self.matrix.rows[name] for name in self.meal_plan.names(day))
+
+        columns = set()
+        for changed_row, count in counts.items():
+            if count:
+                columns.update(self._add_required(changed_row, count))
+        self._refresh(columns)
+        return days
+
+    # meal_plan.txt with the shopping list appended, like main() writes it
+    def write_text(self, output_filename='meal_plan.txt'):
+        self.meal_plan.write_text(output_filename)
+        write_shopping_list(self.shopping_list, output_filename)
+
+# Several weeks planned in one go (plan_weeks): one MealPlan per week and one
+# shopping list per purchase window of purchase_days days
+class MultiWeekPlan:
+    def __init__(self, weeks, shopping_lists, purchase_days=7):
+        self.weeks = weeks
+        self.shopping_lists = shopping_lists
+        self.purchase_days = purchase_days
+
+    # (first day, last day) of every purchase window, counting days from 1
+    def purchase_windows(self):
+        total_days = sum(len(week) for week in self.weeks)
+        return [(start + 1, min(start + self.purchase_days, total_days))
+                for start in range(0, total_days, self.purchase_days)]
+
+    def counts(self):
+        counts = Counter()
+        for week in self.weeks:
+            counts.update(week.counts())
+        return counts
+
+    def to_json(self):
+        return {
+            'weeks': [week.to_json() for week in self.weeks],
+            'shopping_lists': [{'days': list(days), 'shopping_list': shopping_list}
+                               for days, shopping_list in zip(self.purchase_windows(), self.shopping_lists)],
+        }
+
+    def write_text(self, output_filename='meal_plan.txt'):
+        with open(output_filename, 'w') as file:
+            for number, week in enumerate(self.weeks, 1):
+                file.write(f"\nWeek {number}:\n")
+                file.write(week.to_text())
+        for (first_day, last_day), shopping_list in zip(self.purchase_windows(), self.shopping_lists):
+            with open(output_filename, 'a') as file:
+                file.write(f"\nDays {first_day}-{last_day}:")
+            write_shopping_list(shopping_list, output_filename)
+        print(f"Meal plan has been written to {output_filename}")
+
+# Best days kept between searches by plan_weeks
+DAY_POOL_SIZE = 512
+
+# Plans weeks of meals in one call. Besides no repeats within a day:
+# - min_days_between: days that must pass before a recipe comes back (1 = never on
+#   two days in a row)
+# - max_per_week: times a recipe may be planned in one week
+# - max_weeks_in_a_row: weeks in a row a recipe may appear before it sits one out
+# None turns a limit off. A day the limits leave too few (or no) recipes to fill is
+# planned from every recipe instead. With the optimize engine the good days every
+# search finds are kept in a pool, and later days take the best pooled day the limits
+# allow before searching again, so most days need no search at all. A day leaves the
+# pool once it is planned, so the pool never hands out the same whole day twice (a
+# later search can still find it again if the limits allow it). The pantry is
+# used up window by window: whatever one purchase window doesn't need carries over.
+@instrumented('plan_weeks')
+def plan_weeks(selected_recipes, selected_diet, weeks=12, available_ingredients=None, engine='optimize', seed=None,
+               min_days_between=1, max_per_week=2, max_weeks_in_a_row=None, purchase_days=7):
+    plan_day, goals, lower_calorie_limit, upper_calorie_limit = _planning_setup(selected_diet, engine)
+    rng = random.Random(seed)
+    recipes = list({recipe["name"]: recipe for recipe in selected_recipes}.values())
+    nutrition = nutrition_matrix(recipes)
+
+    last_planned = np.full(len(recipes), -(min_days_between or 0) - 1)  # day number each recipe was last planned
+    week_uses = np.zeros(len(recipes), dtype=np.int64)
+    weeks_in_a_row = np.zeros(len(recipes), dtype=np.int64)
+    pool = {} if plan_day is plan_day_optimize else None  # rows -> score
+    ranked_pool = []
+
+    def search(candidates):
+        found = [] if pool is not None else None
+        if pool is not None:
+            rows = _optimize_day(nutrition[candidates], goals, lower_calorie_limit, upper_calorie_limit, rng, found)
+        else:
+            rows = plan_day(nutrition[candidates], goals, lower_calorie_limit, upper_calorie_limit, rng)
+        if metrics.active is not None:
+            metrics.active.count('plan_weeks.searches')
+        if found:
+            for score, found_rows in found:
+                key = tuple(sorted(int(candidates[row]) for row in found_rows))
+                pool[key] = min(score, pool.get(key, np.inf))
+            ranked_pool[:] = sorted(pool.items(), key=lambda item: item[1])[:DAY_POOL_SIZE]
+            pool.clear()
+            pool.update(ranked_pool)
+        rows = [int(candidates[row]) for row in rows]
+        # The day being planned is taken out of the pool, so it can't come back whole later
+        if pool and pool.pop(tuple(sorted(rows)), None) is not None:
+            ranked_pool[:] = [item for item in ranked_pool if item[0] in pool]
+        return rows
+
+    meal_plans = []
+    for week in range(weeks):
+        meal_plan = MealPlan()
+        week_uses[:] = 0
+        resting = weeks_in_a_row >= max_weeks_in_a_row if max_weeks_in_a_row else np.zeros(len(recipes), dtype=bool)
+        for day_number, day in enumerate(meal_plan):
+            print(f"Creating meal plan for {day} of week {week + 1}.")
+            today = week * len(meal_plan) + day_number
+            allowed = ~resting
+            if min_days_between:
+                allowed &= today - last_planned > min_days_between
+            if max_per_week:
+                allowed &= week_uses < max_per_week
+
+            position = next((position for position, (rows, _) in enumerate(ranked_pool) if allowed[list(rows)].all()), None)
+            if position is not None:
+                # A pooled day is used once, the same day never comes back whole
+                rows = list(ranked_pool.pop(position)[0])
+                del pool[tuple(rows)]
+                if metrics.active is not None:
+                    metrics.active.count('plan_weeks.pool_hits')
+            elif recipes:
+                candidates = np.flatnonzero(allowed)
+                rows = search(candidates) if len(candidates) else []
+                if nutrition[rows, 0].sum() < lower_calorie_limit and not allowed.all():
+                    # The limits leave too little to fill the day, plan it from every recipe
+                    rows = search(np.arange(len(recipes)))
+                    if metrics.active is not None:
+                        metrics.active.count('plan_weeks.relaxed_days')
+            else:
+                rows = []
+
+            for row in rows:
+                meal_plan.add(day, recipes[row])
+                last_planned[row] = today
+                week_uses[row] += 1
+            if meal_plan[day]["calories"] < lower_calorie_limit:
+                print(f"Could not fill {day}'s meal plan to the calorie goal. Consider adding more recipes.")
+                if metrics.active is not None:
+                    metrics.active.count('plan_meals.underfilled_days')
+        weeks_in_a_row = np.where(week_uses > 0, weeks_in_a_row + 1, 0)
+        meal_plans.append(meal_plan)
+
+    # Shopping list per purchase window, from one product over every window's counts
+    windows = []
+    for week_number, meal_plan in enumerate(meal_plans):
+        for day_number, day in enumerate(meal_plan):
+            window = (week_number * len(meal_plan) + day_number) // purchase_days
+            if window == len(windows):
+                windows.append(Counter())
+            windows[window].update(meal_plan.names(day))
+    planned = {recipe["name"]: recipe for meal_plan in meal_plans for recipe, _ in meal_plan.recipe_counts()}
+    matrix = IngredientMatrix(planned.values())
+    columns, required = matrix.required(windows)
+    stock = matrix.available(columns, available_ingredients or {})
+    shopping_lists = []
+    for window, window_required in zip(windows, required):
+        shopping_lists.append(_shopping_list_lines(matrix, columns, np.maximum(window_required - stock, 0), window))
+        stock = np.maximum(stock - window_required, 0)
+    return MultiWeekPlan(meal_plans, shopping_lists, purchase_days)
+#MADDIE--------
+# go through recipes
+def parse_recipes(recipes_file):
+    try:
+        with open(recipes_file, 'r') as file:
+            data = json.load(file)
+        # Recipes are in the 'recipes' list, contain 'name', 'ingredients', and 'quantity'
+        recipes = {recipe['name']: {ingredient['ingredient']: ingredient['quantity'] for ingredient in recipe['ingredients']} for recipe in data['recipes']}
+        return recipes
+    except Exception as e:
+        print(f"Error reading recipes file: {e}")
+        return {}  
+
+# recipes were printing with "-", this fixes that
+@instrumented('parse_meal_plan')
+def parse_meal_plan(meal_plan_file):
+    meal_plan = {}
+    
+    with open(meal_plan_file, 'r') as file:
+        for line in file:
+            # Remove leading/trailing spaces and skip empty lines
+            line = line.strip()
+            if not line:
+                continue
+
+            # Check if the line starts with "- ", removes
+            if line.startswith('-'):
+                recipe_name = line[1:].strip()
+                # counts occurences
+                if recipe_name in meal_plan:
+                    meal_plan[recipe_name] += 1
+                else:
+                    meal_plan[recipe_name] = 1
+    
+    return meal_plan
+
+
+# Shopping lists for many meal plans at once. Each plan is a MealPlan or a
+# {recipe name: times planned} dict, pantries line up with the plans. Quantities are
+# summed across the whole plan first and the pantry is taken away once per ingredient.
+@instrumented('build_shopping_lists')
+def build_shopping_lists(meal_plans, recipes, pantries):
+    if all(isinstance(meal_plan, MealPlan) for meal_plan in meal_plans):
+        # The plans already hold their recipes, only those need to be in the matrix
+        planned = {}
+        for meal_plan in meal_plans:
+            for recipe, count in meal_plan.recipe_counts():
+                planned.setdefault(recipe["name"], recipe)
+        matrix = IngredientMatrix(planned.values())
+    else:
+        if not isinstance(recipes, RecipeCatalog):
+            recipes = RecipeCatalog(recipes)
+        matrix = recipes.ingredient_matrix()
+    plans = [meal_plan.counts() if isinstance(meal_plan, MealPlan) else meal_plan for meal_plan in meal_plans]
+
+    columns, required = matrix.required(plans)
+    shopping_lists = []
+    for plan, plan_required, available_ingredients in zip(plans, required, pantries):
+        remaining = np.maximum(plan_required - matrix.available(columns, available_ingredients), 0)
+        shopping_lists.append(_shopping_list_lines(matrix, columns, remaining, plan))
+    return shopping_lists
+
+# Shopping list entries for the matrix columns still needed (remaining is in base
+# units), shown in the units of the recipes planned (names of the recipes in the plan)
+def _shopping_list_lines(matrix, columns, remaining, planned):
+    display_units = matrix.display_units(planned)
+    shopping_list = {}
+    for column, quantity in zip(columns, remaining):
+        if quantity <= 1e-9:
+            continue
+        ingredient_name, base = matrix.column_keys[column]
+        unit, factor = display_units.get(column, (base, 1))
+        # Same ingredient in units that don't convert (e.g. cups and heads) gets its own line
+        key = ingredient_name if ingredient_name not in shopping_list else f"{ingredient_name} ({unit})"
+        shopping_list[key] = {'quantity': _tidy_quantity(quantity / factor), 'unit': unit}
+    return shopping_list
+
+# Ingredients still needed for a MealPlan, or a {recipe name: times planned} dict
+# like parse_meal_plan returns, after taking away what the user already has
+def build_shopping_list(meal_plan, recipes, available_ingredients):
+    return build_shopping_lists([meal_plan], recipes, [available_ingredients])[0]
+
+def write_shopping_list(shopping_list, output_filename='meal_plan.txt'):
+    # Write the shopping list to meal_plan.txt
+    try:
+        with open(output_filename, 'a') as file:
+            file.write("\nShopping List:\n")
+            for ingredient, details in shopping_list.items():
+                unit = details['unit']
+                total_quantity = details['quantity']
+
+                if total_quantity > 1 and not unit.endswith('s') and unit not in ABBREVIATED_UNITS:
+                    unit += 's'
+                    
+                file.write(f"{ingredient}: {total_quantity} {unit}\n")
+
+        print(f"Shopping list has been successfully appended to {output_filename}.")
+    except Exception as e:
+        print(f"Error appending shopping list: {e}")
+
+# Each input can be what's already in memory (a MealPlan, a RecipeCatalog or recipe
+# list, the load_ingredients dict) or the file to load it from. The shopping list is
+# appended to output_filename unless it is None
+@instrumented('generate_shopping_list')
+def generate_shopping_list(meal_plan, recipes, ingredients, output_filename='meal_plan.txt'):
+    if not isinstance(meal_plan, dict):
+        meal_plan = parse_meal_plan(meal_plan)
+
+    # Recipes are only needed when the plan is just names
+    if not isinstance(meal_plan, MealPlan):
+        if isinstance(recipes, str):
+            # Load recipes from the JSON file
+            recipes = RecipeCatalog.from_file(recipes)
+        elif not isinstance(recipes, RecipeCatalog):
+            recipes = RecipeCatalog(recipes)
+
+    # User available ingredients from CSV file
+    if isinstance(ingredients, str):
+        ingredients = load_ingredients(ingredients)
+
+    shopping_list = build_shopping_list(meal_plan, recipes, ingredients)
+    if output_filename is not None:
+        write_shopping_list(shopping_list, output_filename)
+    return shopping_list
+#XAVIER-------
+# matplotlib is imported when a chart is actually drawn, so importing this module
+# and headless runs don't pay for it
+
+# Draws the stacked daily nutrition bars on a new axes, returns the axes and one bar
+# container per nutrient
+def _draw_day_nutrition_totals(figure, day_nutrition_totals):
+    # Prepare data for plotting
+    days = list(day_nutrition_totals.keys())
+    calories = [day_nutrition_totals[day]['calories'] for day in days]
+    protein = [day_nutrition_totals[day]['protein'] for day in days]
+    carbs = [day_nutrition_totals[day]['carbs'] for day in days]
+    fat = [day_nutrition_totals[day]['fat'] for day in days]
+    fiber = [day_nutrition_totals[day]['fiber'] for day in days]
+
+    #Plotting 
+    axes = figure.add_subplot()
+    bars = [
+        axes.bar(days, calories, label='Calories', color='red'),
+        axes.bar(days, protein, bottom=calories, label='Protein', color='blue'),
+        axes.bar(days, carbs, bottom=[calories[i] + protein[i] for i in range(len(days))], label='Carbs', color='green'),
+        axes.bar(days, fat, bottom=[calories[i] + protein[i] + carbs[i] for i in range(len(days))], label='Fat', color='orange'),
+        axes.bar(days, fiber, bottom=[calories[i] + protein[i] + carbs[i] + fat[i] for i in range(len(days))], label='Fiber', color='purple'),
+    ]
+    #Labels
+    axes.set_xlabel('Days of the Week')
+    axes.set_ylabel('Nutritional Values')
+    axes.set_title('Daily Nutrition Totals (Stacked Bar Graph)')
+    axes.legend()
+    axes.tick_params(axis='x', labelrotation=45)
+    figure.tight_layout()
+    return axes, bars
+
+# With output_filename the chart is saved (.png, .svg, ...) instead of shown in a window
+def plot_day_nutrition_totals(day_nutrition_totals, output_filename=None):
+    if output_filename is not None:
+        NutritionChartRenderer(list(day_nutrition_totals)).render(day_nutrition_totals, output_filename)
+        print(f"Nutrition chart has been written to {output_filename}")
+        return
+
+    import matplotlib.pyplot as plt
+    figure = plt.figure(figsize=(10, 6))
+    _draw_day_nutrition_totals(figure, day_nutrition_totals)
+    plt.show()
+
+# PNG backgrounds (everything but the bars and legend) kept per y axis limit
+CHART_BACKGROUNDS = 8
+
+# Off-screen nutrition chart that is drawn once and then re-used: every render only
+# moves the existing bars to the new plan's values before saving, instead of building
+# a new figure, axes, legend and labels. Uses the Agg canvas directly, no GUI needed.
+# PNGs are blitted: the axes, ticks and labels are drawn once per y axis limit and
+# copied, and each chart only draws its bars and legend over that copy. Other
+# formats (svg, pdf, ...) are saved from the whole figure.
+class NutritionChartRenderer:
+    def __init__(self, days=DAYS, figsize=(10, 6), dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        self.days = list(days)
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        # Drawn with a typical day so the layout leaves room for 4 digit tick labels
+        template = {day: {'calories': 2000, 'protein': 100, 'carbs': 200, 'fat': 70, 'fiber': 30} for day in self.days}
+        self.axes, self.bars = _draw_day_nutrition_totals(self.figure, template)
+        self.backgrounds = OrderedDict()  # y axis limit -> saved canvas region
+
+    def update(self, day_nutrition_totals):
+        if list(day_nutrition_totals) != self.days:
+            raise ValueError(f"Chart is set up for {', '.join(self.days)}")
+        bottoms = np.zeros(len(self.days))
+        for key, bars in zip(NUTRIENTS, self.bars):
+            heights = [day_nutrition_totals[day][key] for day in self.days]
+            for bar, bottom, height in zip(bars, bottoms, heights):
+                bar.set_y(bottom)
+                bar.set_height(height)
+            bottoms += heights
+        # Rounded up to half a power of ten so plans of similar size share a background
+        limit = max(bottoms.max(), 1) * 1.05
+        step = 10 ** np.floor(np.log10(limit)) / 2
+        self.axes.set_ylim(0, np.ceil(limit / step) * step)
+
+    def _moving_artists(self):
+        return [bar for bars in self.bars for bar in bars] + [self.axes.get_legend()]
+
+    def _blit(self):
+        limit = self.axes.get_ylim()
+        background = self.backgrounds.get(limit)
+        if background is None:
+            # Animated artists are left out of canvas.draw(), only the static part is drawn
+            for artist in self._moving_artists():
+                artist.set_animated(True)
+            self.canvas.draw()
+            for artist in self._moving_artists():
+                artist.set_animated(False)
+            background = self.backgrounds[limit] = self.canvas.copy_from_bbox(self.figure.bbox)
+            if len(self.backgrounds) > CHART_BACKGROUNDS:
+                self.backgrounds.popitem(last=False)
+        else:
+            self.backgrounds.move_to_end(limit)
+        self.canvas.restore_region(background)
+        for artist in self._moving_artists():
+            self.axes.draw_artist(artist)
+
+    # Saves the chart for one plan to output (a filename or file object), or returns
+    # the image bytes when output is None
+    def render(self, day_nutrition_totals, output=None, format=None):
+        from matplotlib.image import imsave
+        self.update(day_nutrition_totals)
+        if format is None:
+            format = os.path.splitext(output)[1][1:].lower() if isinstance(output, str) else ''
+            format = format or 'png'
+        target = io.BytesIO() if output is None else output
+        if format == 'png':
+            self._blit()
+            imsave(target, np.asarray(self.canvas.buffer_rgba()), format='png', dpi=self.figure.dpi)
+        else:
+            self.figure.savefig(target, format=format)
+        return target.getvalue() if output is None else output
+
+# Renderer each chart worker process re-uses, set once by _init_chart_worker
+_chart_renderer = None
+
+def _init_chart_worker():
+    global _chart_renderer
+    _chart_renderer = NutritionChartRenderer()
+
+def _render_chart_job(job):
+    name, day_nutrition_totals, output_dir, format = job
+    if output_dir is None:
+        return name, _chart_renderer.render(day_nutrition_totals, None, format)
+    output_filename = os.path.join(output_dir, f"{name}.{format}")
+    return name, _chart_renderer.render(day_nutrition_totals, output_filename, format)
+
+# Renders a chart per plan ({name: day -> nutrition totals}, e.g. MealPlans). Charts
+# are written to output_dir/<name>.<format> or returned as {name: image bytes}.
+# With more than one worker the plans are split across processes, each re-using
+# its own renderer.
+def render_nutrition_charts(plans, output_dir=None, format='png', workers=1):
+    global _chart_renderer
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    jobs = [(str(name), {day: dict(totals) for day, totals in day_nutrition_totals.items()}, output_dir, format)
+            for name, day_nutrition_totals in plans.items()]
+
+    if workers == 1:
+        if _chart_renderer is None:
+            _chart_renderer = NutritionChartRenderer()
+        return dict(_render_chart_job(job) for job in jobs)
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker) as executor:
+        return dict(executor.map(_render_chart_job, jobs, chunksize=chunksize))
+
+# Plan cache --------
+# Memoizes (MealPlan, shopping list) results. Keys are a hash of everything a plan
+# depends on, so a changed recipes file, recipe selection, goal, pantry or seed is a
+# different key. Recent results stay in memory (least recently used are evicted past
+# max_entries); with a directory they are also pickled to disk and survive restarts.
+# Cached MealPlans are shared between callers and shouldn't be modified.
+class PlanCache:
+    def __init__(self, max_entries=256, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.catalog_version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(catalog_version, selected_recipes, nutritional_goals, available_ingredients, seed, engine='optimize'):
+        content = json.dumps({
+            'catalog': catalog_version,
+            'recipes': sorted(recipe["name"] for recipe in selected_recipes),
+            'goals': nutritional_goals,
+            'pantry': available_ingredients,
+            'seed': seed,
+            'engine': engine,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.plan")
+
+    # Drops everything cached for an older version of the recipes
+    def use_catalog_version(self, catalog_version):
+        if catalog_version == self.catalog_version:
+            return
+        if self.catalog_version is not None:
+            self.clear()
+        self.catalog_version = catalog_version
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.directory is not None:
+            try:
+                with open(self._disk_path(key), 'rb') as file:
+                    catalog_version, value = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None
+            else:
+                if catalog_version == self.catalog_version or self.catalog_version is None:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                    return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory is not None:
+            temporary_filename = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+            with open(temporary_filename, 'wb') as file:
+                pickle.dump((self.catalog_version, value), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_filename, self._disk_path(key))
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.plan'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+# plan_meals + build_shopping_list through a PlanCache, returns (MealPlan, shopping list)
+def cached_meal_plan(cache, recipes, selected_recipes, selected_diet, available_ingredients, engine='optimize', seed=None):
+    if not isinstance(recipes, RecipeCatalog):
+        recipes = RecipeCatalog(recipes)
+    cache.use_catalog_version(recipes.version)
+    key = PlanCache.key(cache.catalog_version, selected_recipes, selected_diet["nutritional_goals"],
+                        available_ingredients, seed, engine)
+    result = cache.get(key)
+    if result is None:
+        meal_plan = plan_meals(selected_recipes, selected_diet, engine, seed)
+        result = (meal_plan, build_shopping_list(meal_plan, recipes, available_ingredients))
+        cache.put(key, result)
+    return result
+
+# Batch planning --------
+# Catalog each batch worker process plans against, set once by _init_batch_worker
+_batch_catalog = None
+_batch_cache = None
+
+def _init_batch_worker(recipes, cache_dir=None):
+    global _batch_catalog, _batch_cache
+    _batch_catalog = recipes if isinstance(recipes, RecipeCatalog) else RecipeCatalog(recipes)
+    # Workers share finished plans through the cache folder
+    _batch_cache = PlanCache(directory=cache_dir) if cache_dir else None
+    # Thousands of users worth of progress prints would only slow the workers down
+    sys.stdout = open(os.devnull, 'w')
+
+# Full pipeline for one preference profile (same shape as a user_preferences entry)
+@instrumented('plan_profile')
+def plan_profile(profile, recipes, pantry_file=None, engine='optimize', seed=None, cache=None):
+    available_ingredients = load_ingredients(pantry_file) if pantry_file else {}
+    recommended_recipes = recommend_recipes(recipes, {'selected_preference': profile}, available_ingredients)
+    if cache is not None:
+        meal_plan, shopping_list = cached_meal_plan(cache, recipes, recommended_recipes, profile,
+                                                    available_ingredients, engine, seed)
+    else:
+        meal_plan = plan_meals(recommended_recipes, profile, engine, seed)
+        shopping_list = build_shopping_list(meal_plan, recipes, available_ingredients)
+    result = {'diet': profile.get('diet')}
+    result.update(meal_plan.to_json())
+    result['shopping_list'] = shopping_list
+    return result
+
+def _plan_batch_job(job):
+    user_id, profile, pantry_file, engine, seed, output_dir, collect_metrics = job
+    # Workers record their own metrics and send them back with the result
+    if collect_metrics:
+        enable_metrics()
+    # Per-user seeds keep every plan reproducible no matter which worker runs it
+    user_seed = None if seed is None else f"{seed}:{user_id}"
+    # A profile that can't be planned is reported in its place instead of
+    # stopping the whole batch
+    try:
+        result = {'user_id': user_id}
+        result.update(plan_profile(profile, _batch_catalog, pantry_file, engine, user_seed, _batch_cache))
+        if output_dir is not None:
+            output_filename = os.path.join(output_dir, f"{user_id}.json")
+            with open(output_filename, 'w') as file:
+                json.dump(result, file, indent=2)
+            result = {'user_id': user_id, 'output': output_filename}
+    except Exception as e:
+        result = {'user_id': user_id, 'error': f"{type(e).__name__}: {e}"}
+    return result, disable_metrics().to_json() if collect_metrics else None
+
+# Plans every profile across a process pool. The catalog is handed to each worker
+# once when it starts instead of being re-read or re-sent per user. Profiles can
+# carry a 'user_id' and a 'pantry' CSV path, pantry_files ({user_id: path}) overrides
+# the latter. Results are written to output_dir/<user_id>.json, streamed to one
+# JSONL file, or returned when neither is given. Users that couldn't be planned get
+# a {'user_id', 'error'} record instead. With cache_dir, plans are memoized there
+# across workers and runs.
+def plan_batch(profiles, recipes, pantry_files=None, output_dir=None, jsonl_filename=None,
+               workers=None, engine='optimize', seed=None, cache_dir=None):
+    if engine not in PLANNING_ENGINES:
+        raise ValueError(f"Unknown planning engine '{engine}'. Choose from: {', '.join(PLANNING_ENGINES)}")
+    if not isinstance(recipes, RecipeCatalog):
+        recipes = RecipeCatalog(recipes)
+    pantry_files = pantry_files or {}
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    jobs = []
+    for index, profile in enumerate(profiles, start=1):
+        user_id = str(profile.get('user_id', index))
+        pantry_file = pantry_files.get(user_id, profile.get('pantry'))
+        jobs.append((user_id, profile, pantry_file, engine, seed, output_dir, metrics.active is not None))
+
+    workers = workers or os.cpu_count() or 1
+    # Hand out work in chunks so the pool isn't dominated by per-task messaging
+    chunksize = max(1, len(jobs) // (workers * 4))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(recipes, cache_dir)) as executor:
+        outcomes = executor.map(_plan_batch_job, jobs, chunksize=chunksize)
+        file = open(jsonl_filename, 'w') if jsonl_filename is not None else None
+        try:
+            for result, recorded in outcomes:
+                if recorded is not None and metrics.active is not None:
+                    metrics.active.merge(recorded)
+                if file is not None:
+                    file.write(json.dumps(result) + "\n")
+                    if 'error' not in result:
+                        result = {'user_id': result['user_id'], 'output': jsonl_filename}
+                results.append(result)
+        finally:
+            if file is not None:
+                file.close()
+
+    failed = sum(1 for result in results if 'error' in result)
+    print(f"Planned {len(results) - failed} profiles with {workers} workers, {failed} failed.")
+    return results
+
+# Non-interactive counterpart to pick_from_sorted. include picks exactly those
+# recipes (by name, from the whole catalog); exclude removes recipes from the
+# recommendations or the included ones
+def select_recipes(recommended_recipes, recipes, include=None, exclude=None):
+    if include:
+        selected_recipes = []
+        for name in include:
+            recipe = recipes.get(name)
+            if recipe is None:
+                print(f"Warning: recipe '{name}' not found, skipping it.")
+            else:
+                selected_recipes.append(recipe)
+    else:
+        selected_recipes = list(recommended_recipes)
+    excluded = set(exclude or [])
+    return [recipe for recipe in selected_recipes if recipe["name"] not in excluded]
+
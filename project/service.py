@@ -0,0 +1,396 @@
+import os
+import json
+import asyncio
+import base64
+import threading
+from http import HTTPStatus
+from concurrent.futures import ProcessPoolExecutor
+
+from project import metrics, planner
+from project.loaders import _read_json, is_store_file, load_cached, load_cached_version
+from project.catalog import RecipeCatalog
+from project.store import MealPlannerStore
+from project.planner import (PLANNING_ENGINES, NutritionChartRenderer, _init_batch_worker, build_shopping_list,
+                             plan_meals, recommend_recipes, select_recipes)
+
+# Planning service --------
+# Long-running asyncio service for frontends that would otherwise start
+# main_menu.py per user. The catalog and preferences are loaded once and reloaded
+# when their files change. Requests queue up (at most max_pending, beyond that they
+# are turned away so callers can back off), are grouped into batches of up to
+# batch_size and solved in worker processes that hold the catalog, like batch
+# planning. workers=0 solves in threads of this process instead.
+class ServiceBusy(RuntimeError):
+    pass
+
+# Chart renderer for the calling thread. With workers=0 batches run in several
+# threads at once and a shared Figure would mix up their charts
+_thread_state = threading.local()
+
+def _thread_chart_renderer():
+    renderer = getattr(_thread_state, 'chart_renderer', None)
+    if renderer is None:
+        renderer = _thread_state.chart_renderer = NutritionChartRenderer()
+    return renderer
+
+def _serve_job(catalog, job):
+    profile, available_ingredients, include, exclude, engine, seed, top_k, chart_format = job
+    recommended_recipes = recommend_recipes(catalog, {'selected_preference': profile}, available_ingredients, top_k)
+    selected_recipes = select_recipes(recommended_recipes, catalog, include, exclude)
+    meal_plan = plan_meals(selected_recipes, profile, engine, seed)
+    result = {'diet': profile.get('diet')}
+    result.update(meal_plan.to_json())
+    result['shopping_list'] = build_shopping_list(meal_plan, catalog, available_ingredients)
+    if chart_format is not None:
+        chart = _thread_chart_renderer().render(meal_plan, None, chart_format)
+        result['chart'] = base64.b64encode(chart).decode('ascii')
+    return result
+
+# Runs a batch of jobs, one bad request doesn't fail the others. ValueErrors are
+# the request's fault ('error'), anything else is a bug on our side ('failed')
+def _serve_batch(jobs, catalog=None):
+    catalog = planner._batch_catalog if catalog is None else catalog
+    results = []
+    for job in jobs:
+        try:
+            results.append(('ok', _serve_job(catalog, job)))
+        except ValueError as e:
+            results.append(('error', str(e)))
+        except Exception as e:
+            results.append(('failed', f"{type(e).__name__}: {e}"))
+    return results
+
+# Reads the service's data files strictly: a broken or half-written file raises
+# instead of coming back empty like load_recipes and load_preferences do
+def _read_service_files(recipes_file, preferences_file):
+    version = None
+    if is_store_file(recipes_file):
+        with MealPlannerStore(recipes_file, create=False) as store:
+            recipes = store.load_recipes()
+    else:
+        recipes, version = load_cached_version(recipes_file, 'recipes', _read_json)
+        recipes = recipes.get('recipes') if isinstance(recipes, dict) else None
+    if not isinstance(recipes, list):
+        raise ValueError(f"{recipes_file} has no list of recipes")
+
+    if is_store_file(preferences_file):
+        with MealPlannerStore(preferences_file, create=False) as store:
+            preferences = store.load_preferences()
+    else:
+        preferences = load_cached(preferences_file, 'preferences', _read_json)
+    if not isinstance(preferences, dict) or not isinstance(preferences.get('user_preferences'), list):
+        raise ValueError(f"{preferences_file} has no list of user_preferences")
+
+    catalog = RecipeCatalog(recipes)
+    catalog.source, catalog.source_version = recipes_file, version
+    return catalog, preferences
+
+# Checks a profile has what planning reads from it, so a bad one is answered
+# with a 400 instead of failing inside the planner
+def _check_profile(profile):
+    if not isinstance(profile, dict):
+        raise ValueError("profile must be an object")
+    goals = profile.get('nutritional_goals')
+    if not isinstance(goals, dict) or 'calories' not in goals:
+        raise ValueError("profile needs nutritional_goals with at least calories")
+    for key, value in goals.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            raise ValueError(f"nutritional goal '{key}' must be a number")
+    return profile
+
+def _check_request(request):
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+    pantry = request.get('pantry') or {}
+    if not isinstance(pantry, dict) or not all(isinstance(item, dict) and isinstance(item.get('quantity', 0), (int, float))
+                                               and isinstance(item.get('unit', ''), str) for item in pantry.values()):
+        raise ValueError("pantry must map ingredients to {'quantity': number, 'unit': text}")
+    for key in ('diet', 'engine'):
+        value = request.get(key)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{key} must be text")
+    for key in ('include', 'exclude'):
+        names = request.get(key)
+        if names is not None and (not isinstance(names, list) or not all(isinstance(name, str) for name in names)):
+            raise ValueError(f"{key} must be a list of recipe names")
+    for key in ('seed', 'top_k'):
+        value = request.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError(f"{key} must be a whole number")
+
+def _shut_down(future):
+    if not future.done():
+        future.set_exception(ServiceBusy("The planning service is shutting down"))
+
+class PlanningService:
+    def __init__(self, recipes_file='recipes.json', preferences_file='preferences.json', workers=None,
+                 max_pending=64, batch_size=8, batch_delay=0.002, reload_interval=1.0):
+        self.recipes_file = recipes_file
+        self.preferences_file = preferences_file
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.reload_interval = reload_interval
+        self.catalog = None
+        self.preferences = {}
+        self.executor = None
+        self.queue = None
+        self._stamps = None
+        self._tasks = []
+        self._batches = set()  # batches in flight, held so they aren't garbage collected
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_pending)
+        # Batches in flight are capped, so a backlog waits in the bounded queue
+        self._in_flight = asyncio.Semaphore(max(1, self.workers) * 2)
+        await self.reload()
+        self._tasks = [asyncio.create_task(self._batcher())]
+        if self.reload_interval:
+            self._tasks.append(asyncio.create_task(self._watch()))
+
+    # Stops taking work, lets the batches in flight finish and turns away whatever
+    # was still queued so no caller is left waiting
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        queue, self.queue = self.queue, None
+        await asyncio.gather(*self._batches, return_exceptions=True)
+        while queue is not None and not queue.empty():
+            _shut_down(queue.get_nowait()[1])
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def _file_stamps(self):
+        stamps = {}
+        for filename in (self.recipes_file, self.preferences_file):
+            stat = os.stat(filename)
+            stamps[filename] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    # Loads the files off the event loop and swaps in the new catalog and workers.
+    # Work already handed to the old workers still finishes. If a file can't be read
+    # the old catalog, preferences and stamps stay, so the next check tries again.
+    async def reload(self):
+        loop = asyncio.get_running_loop()
+        stamps = self._file_stamps()
+        catalog, preferences = await loop.run_in_executor(None, _read_service_files, self.recipes_file,
+                                                          self.preferences_file)
+        old_executor = self.executor
+        self.catalog, self.preferences, self._stamps = catalog, preferences, stamps
+        if self.workers:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_batch_worker,
+                                                initargs=(catalog,))
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+        if metrics.active is not None:
+            metrics.active.count('service.reloads')
+
+    async def check_reload(self):
+        if self._file_stamps() != self._stamps:
+            await self.reload()
+            return True
+        return False
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.check_reload()
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not reload the data files: {e}")
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                deadline = loop.time() + self.batch_delay
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                        continue
+                    except asyncio.QueueEmpty:
+                        pass
+                    if loop.time() >= deadline:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        break
+                await self._in_flight.acquire()
+                task = asyncio.create_task(self._run_batch(batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # Requests taken off the queue but not yet handed to a batch
+            for _, future in batch:
+                _shut_down(future)
+            raise
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        jobs = [job for job, _ in batch]
+        try:
+            if metrics.active is not None:
+                metrics.active.count('service.batches')
+                metrics.active.record('service.batch_size', len(jobs))
+            if self.executor is not None:
+                results = await loop.run_in_executor(self.executor, _serve_batch, jobs)
+            else:
+                results = await loop.run_in_executor(None, _serve_batch, jobs, self.catalog)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._in_flight.release()
+
+    def _profile(self, request):
+        if 'profile' in request:
+            return _check_profile(request['profile'])
+        diet = str(request.get('diet', ''))
+        for profile in self.preferences.get('user_preferences', []):
+            if str(profile.get('diet', '')).lower() == diet.lower():
+                return _check_profile(profile)
+        available_diets = ", ".join(pref["diet"] for pref in self.preferences.get("user_preferences", []))
+        raise ValueError(f"Unknown diet '{diet}'. Available diets: {available_diets}")
+
+    # One request: {'diet' (or a whole 'profile'), 'pantry', 'include', 'exclude',
+    # 'engine', 'seed', 'top_k', 'chart' ('png' or 'svg')}. Returns the plan and
+    # shopping list as plan --output x.json writes them, with the chart base64 encoded
+    async def plan(self, request):
+        _check_request(request)
+        engine = request.get('engine', 'optimize')
+        if engine not in PLANNING_ENGINES:
+            raise ValueError(f"Unknown planning engine '{engine}'. Choose from: {', '.join(PLANNING_ENGINES)}")
+        if request.get('chart') not in (None, 'png', 'svg'):
+            raise ValueError("chart must be 'png' or 'svg'")
+        job = (self._profile(request), request.get('pantry') or {}, request.get('include'), request.get('exclude'),
+               engine, request.get('seed'), request.get('top_k'), request.get('chart'))
+
+        if self.queue is None:
+            raise ServiceBusy("The planning service is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((job, future))
+        except asyncio.QueueFull:
+            if metrics.active is not None:
+                metrics.active.count('service.rejected')
+            raise ServiceBusy(f"More than {self.max_pending} requests are waiting, try again later")
+        if metrics.active is not None:
+            metrics.active.count('service.requests')
+        status, value = await future
+        if status == 'error':
+            raise ValueError(value)
+        if status == 'failed':
+            raise RuntimeError(value)
+        return value
+
+    # Routes one HTTP request, returns (status code, JSON-able body)
+    async def dispatch(self, method, path, body=b''):
+        try:
+            if method == 'GET' and path == '/health':
+                return 200, {'status': 'ok', 'recipes': len(self.catalog), 'catalog_version': self.catalog.version,
+                             'pending': self.queue.qsize() if self.queue is not None else 0}
+            if method == 'GET' and path == '/diets':
+                return 200, [profile['diet'] for profile in self.preferences.get('user_preferences', [])]
+            if method == 'POST' and path == '/plan':
+                return 200, await self.plan(json.loads(body or b'{}'))
+            if method == 'POST' and path == '/plans':
+                requests = json.loads(body or b'[]')
+                if not isinstance(requests, list):
+                    raise ValueError("POST /plans takes a list of requests")
+                outcomes = await asyncio.gather(*(self.plan(request) for request in requests), return_exceptions=True)
+                for outcome in outcomes:
+                    if isinstance(outcome, BaseException) and not isinstance(outcome, Exception):
+                        raise outcome
+                return 200, [outcome if isinstance(outcome, dict) else {'error': str(outcome)} for outcome in outcomes]
+            return 404, {'error': f"No route for {method} {path}"}
+        except ServiceBusy as e:
+            return 503, {'error': str(e)}
+        except ValueError as e:
+            # Bad JSON (json.JSONDecodeError is a ValueError) or a request of the wrong shape
+            return 400, {'error': str(e)}
+        except Exception as e:
+            print(f"Error: planning request failed: {type(e).__name__}: {e}")
+            return 500, {'error': f"Internal error: {e}"}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.dispatch(method, path, body)
+                data = json.dumps(payload).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # Serves HTTP on host:port, or on a Unix socket at unix_path, until cancelled
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None):
+        async with self:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+                print(f"Serving meal plans on {unix_path}")
+            else:
+                server = await asyncio.start_server(self._handle_connection, host, port)
+                print(f"Serving meal plans on http://{host}:{server.sockets[0].getsockname()[1]}")
+            async with server:
+                await server.serve_forever()
+
+# Talks to a PlanningService in the same process, through the same routes as HTTP
+class PlanningClient:
+    def __init__(self, service):
+        self.service = service
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        return await self.service.dispatch(method, path, body)
+
+    async def plan(self, **request):
+        status, body = await self.request('POST', '/plan', request)
+        if status == 503:
+            raise ServiceBusy(body['error'])
+        if status == 500:
+            raise RuntimeError(body['error'])
+        if status != 200:
+            raise ValueError(body['error'])
+        return body
+
+    async def health(self):
+        return (await self.request('GET', '/health'))[1]
+
@@ -0,0 +1,238 @@
+import os
+import json
+import errno
+import sqlite3
+
+from project.loaders import NUTRIENTS, RECIPE_KEYS, _read_ingredients, _read_json, _stream_recipes, iter_valid_recipes
+
+# SQLite store --------
+# Optional backend keeping recipes, the pantry and preferences in one SQLite file.
+# Diet and ingredient lookups run as indexed queries so only the matching recipes
+# are read, and pantry changes are written in place instead of rewriting the CSV.
+# The loaders (load_recipes, load_ingredients, load_preferences) read from it when
+# given a .db/.sqlite file.
+STORE_SCHEMA_VERSION = 1
+
+STORE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS recipes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    {', '.join(f'{key} NUMERIC' for key in NUTRIENTS)},
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS recipes_name ON recipes (name);
+CREATE TABLE IF NOT EXISTS recipe_tags (
+    recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    tag TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (recipe_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recipe_tags_tag ON recipe_tags (tag);
+CREATE TABLE IF NOT EXISTS recipe_ingredients (
+    recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    ingredient TEXT NOT NULL,
+    ingredient_key TEXT NOT NULL,
+    quantity NUMERIC NOT NULL,
+    unit TEXT,
+    PRIMARY KEY (recipe_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS recipe_ingredients_key ON recipe_ingredients (ingredient_key);
+CREATE TABLE IF NOT EXISTS pantry (
+    ingredient TEXT PRIMARY KEY,
+    quantity REAL NOT NULL,
+    unit TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS preferences (
+    position INTEGER PRIMARY KEY,
+    diet TEXT COLLATE NOCASE,
+    profile TEXT NOT NULL
+);
+PRAGMA user_version = {STORE_SCHEMA_VERSION};
+"""
+
+class MealPlannerStore:
+    def __init__(self, filename, create=True):
+        if not create and not os.path.exists(filename):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), filename)
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if create:
+            self.connection.executescript(STORE_SCHEMA)
+            return
+        # Opening an existing store only reads it, so its schema is checked instead of
+        # re-run (which would write to it and fail on read-only files)
+        version, = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != STORE_SCHEMA_VERSION:
+            self.connection.close()
+            raise ValueError(f"{filename} is not a meal planner store of schema version {STORE_SCHEMA_VERSION} "
+                             f"(found version {version})")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Importing from the existing files, each one replaces what the store had in a
+    # single transaction, so a bad file leaves the old contents in place --------
+    def import_recipes(self, filename):
+        count = 0
+        with self.connection:
+            self.connection.execute("DELETE FROM recipes")
+            for recipe in iter_valid_recipes(_stream_recipes(filename)):
+                self._insert_recipe(recipe)
+                count += 1
+        return count
+
+    def _insert_recipe(self, recipe):
+        nutrition = recipe.get("nutrition", {})
+        extra = {key: value for key, value in recipe.items() if key not in RECIPE_KEYS}
+        extra_nutrition = {key: value for key, value in nutrition.items() if key not in NUTRIENTS}
+        if extra_nutrition:
+            extra["nutrition"] = extra_nutrition
+        cursor = self.connection.execute(
+            f"INSERT INTO recipes (name, {', '.join(NUTRIENTS)}, extra) VALUES (?, {', '.join('?' * len(NUTRIENTS))}, ?)",
+            [recipe["name"], *(nutrition.get(key) for key in NUTRIENTS), json.dumps(extra) if extra else None])
+        recipe_id = cursor.lastrowid
+        self.connection.executemany("INSERT INTO recipe_tags VALUES (?, ?, ?)",
+                                    [(recipe_id, position, tag) for position, tag in enumerate(recipe["tags"])])
+        self.connection.executemany(
+            "INSERT INTO recipe_ingredients VALUES (?, ?, ?, ?, ?, ?)",
+            [(recipe_id, position, ingredient["ingredient"], ingredient["ingredient"].strip().lower(),
+              ingredient["quantity"], ingredient.get("unit"))
+             for position, ingredient in enumerate(recipe["ingredients"])])
+        return recipe_id
+
+    def import_ingredients(self, filename):
+        pantry = _read_ingredients(filename)
+        with self.connection:
+            self.connection.execute("DELETE FROM pantry")
+            self.connection.executemany("INSERT INTO pantry VALUES (?, ?, ?)",
+                                        [(name, item['quantity'], item['unit']) for name, item in pantry.items()])
+        return len(pantry)
+
+    def import_preferences(self, filename):
+        profiles = _read_json(filename).get("user_preferences", [])
+        with self.connection:
+            self.connection.execute("DELETE FROM preferences")
+            self.connection.executemany("INSERT INTO preferences VALUES (?, ?, ?)",
+                                        [(position, profile.get("diet"), json.dumps(profile))
+                                         for position, profile in enumerate(profiles)])
+        return len(profiles)
+
+    # Recipes --------
+    # Recipes matching a WHERE clause on the recipes table, in id order. The recipe,
+    # tag and ingredient rows come back sorted by recipe id and are merged as they
+    # stream in, nothing else is read
+    def _recipes_where(self, condition, parameters=()):
+        subquery = f"SELECT id FROM recipes WHERE {condition}"
+        recipe_rows = self.connection.execute(
+            f"SELECT id, name, {', '.join(NUTRIENTS)}, extra FROM recipes WHERE {condition} ORDER BY id", parameters)
+        tag_rows = self.connection.execute(
+            f"SELECT recipe_id, tag FROM recipe_tags WHERE recipe_id IN ({subquery}) ORDER BY recipe_id, position",
+            parameters)
+        ingredient_rows = self.connection.execute(
+            f"SELECT recipe_id, ingredient, quantity, unit FROM recipe_ingredients "
+            f"WHERE recipe_id IN ({subquery}) ORDER BY recipe_id, position", parameters)
+        tag_row = next(tag_rows, None)
+        ingredient_row = next(ingredient_rows, None)
+
+        recipes = []
+        for recipe_id, name, *values in recipe_rows:
+            extra = json.loads(values.pop()) if values[-1] else {}
+            tags = []
+            while tag_row is not None and tag_row[0] == recipe_id:
+                tags.append(tag_row[1])
+                tag_row = next(tag_rows, None)
+            ingredients = []
+            while ingredient_row is not None and ingredient_row[0] == recipe_id:
+                ingredient = {"ingredient": ingredient_row[1], "quantity": ingredient_row[2]}
+                if ingredient_row[3] is not None:
+                    ingredient["unit"] = ingredient_row[3]
+                ingredients.append(ingredient)
+                ingredient_row = next(ingredient_rows, None)
+            nutrition = {key: value for key, value in zip(NUTRIENTS, values) if value is not None}
+            nutrition.update(extra.pop("nutrition", {}))
+            recipe = {"name": name, "tags": tags, "ingredients": ingredients, "nutrition": nutrition}
+            recipe.update(extra)
+            recipes.append(recipe)
+        return recipes
+
+    def load_recipes(self):
+        return self._recipes_where("1")
+
+    def recipes_with_tags(self, *tags):
+        placeholders = ', '.join('?' * len(tags))
+        return self._recipes_where(f"id IN (SELECT recipe_id FROM recipe_tags WHERE tag IN ({placeholders}))", tags)
+
+    def recipes_using_ingredient(self, ingredient):
+        return self._recipes_where("id IN (SELECT recipe_id FROM recipe_ingredients WHERE ingredient_key = ?)",
+                                   (ingredient.strip().lower(),))
+
+    def recipes_named(self, names):
+        names = list(names)
+        return self._recipes_where(f"name IN ({', '.join('?' * len(names))})", names)
+
+    # First recipe with the name, like RecipeCatalog.get
+    def get(self, name, default=None):
+        recipes = self._recipes_where("id = (SELECT min(id) FROM recipes WHERE name = ?)", (name,))
+        return recipes[0] if recipes else default
+
+    def __contains__(self, name):
+        return self.connection.execute("SELECT 1 FROM recipes WHERE name = ? LIMIT 1", (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM recipes").fetchone()[0]
+
+    # Pantry --------
+    # Same shape as load_ingredients
+    def load_ingredients(self):
+        return {name: {'quantity': quantity, 'unit': unit}
+                for name, quantity, unit in self.connection.execute("SELECT ingredient, quantity, unit FROM pantry")}
+
+    # Sets many pantry items at once, {name: {'quantity', 'unit'}}, or None to remove
+    # the item, all in one transaction
+    def update_pantry(self, changes):
+        changes = {name.strip().lower(): item for name, item in changes.items()}
+        with self.connection:
+            self.connection.executemany("DELETE FROM pantry WHERE ingredient = ?",
+                                        [(name,) for name, item in changes.items() if item is None])
+            self.connection.executemany(
+                "INSERT INTO pantry VALUES (?, ?, ?) ON CONFLICT (ingredient) "
+                "DO UPDATE SET quantity = excluded.quantity, unit = excluded.unit",
+                [(name, float(item['quantity']), (item.get('unit') or '').strip())
+                 for name, item in changes.items() if item is not None])
+
+    # Adds to (or with negative amounts takes away from) the quantities already in the
+    # pantry, e.g. after shopping or cooking, in one transaction. Nothing goes below 0.
+    def adjust_pantry(self, amounts):
+        with self.connection:
+            self.connection.executemany("UPDATE pantry SET quantity = max(quantity + ?, 0) WHERE ingredient = ?",
+                                        [(float(amount), name.strip().lower()) for name, amount in amounts.items()])
+
+    # Preferences --------
+    # Same shape as load_preferences
+    def load_preferences(self):
+        rows = self.connection.execute("SELECT profile FROM preferences ORDER BY position")
+        return {"user_preferences": [json.loads(profile) for profile, in rows]}
+
+    def preference(self, diet):
+        row = self.connection.execute("SELECT profile FROM preferences WHERE diet = ? ORDER BY position LIMIT 1",
+                                      (diet,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+# Creates (or refreshes) a store from the file formats, any file left out is skipped
+def import_store(store_filename, recipes_file=None, ingredients_file=None, preferences_file=None):
+    with MealPlannerStore(store_filename) as store:
+        if recipes_file:
+            print(f"Imported {store.import_recipes(recipes_file)} recipes into {store_filename}")
+        if ingredients_file:
+            print(f"Imported {store.import_ingredients(ingredients_file)} pantry items into {store_filename}")
+        if preferences_file:
+            print(f"Imported {store.import_preferences(preferences_file)} preferences into {store_filename}")
+
@@ -1,5 +1,17 @@
+import asyncio
+import itertools
+import json
+import random
+import os
+import subprocess
+import sys
+import shutil
+import sqlite3
+import tempfile
 import unittest
-from project.main_menu import load_preferences, load_recipes, load_ingredients, pick_preference, recommend_recipes, create_meal_plan, generate_shopping_list
+from project.main_menu import load_preferences, load_recipes, load_ingredients, pick_preference, recommend_recipes, create_meal_plan, generate_shopping_list, RecipeCatalog, plan_batch, build_shopping_list, parse_meal_plan, MealPlan, iter_recipes, iter_valid_recipes, CACHE_DIR_NAME, build_shopping_lists, PlanCache, cached_meal_plan, enable_metrics, disable_metrics, profile_run, run_headless, render_nutrition_charts, NutritionChartRenderer, IngredientMatrix, CompactRecipeCatalog, MealPlannerStore, import_store, IncrementalPlanner, plan_weeks, PlanningService, PlanningClient, ServiceBusy, load_pantry_bulk, plan_day_optimize
+from benchmarks.synthetic_data import generate
+import numpy as np
 
 class TestMealPlanner(unittest.TestCase):
 
@@ -52,6 +64,594 @@ class TestMealPlanner(unittest.TestCase):
         selected_diet = {"user_preferences": {"vegan"}, "nutritional_goals":{"calories": 1400, "protein": 60, "carbs": 210, "fat": 50, "fiber": 35}}
         meal_plan = create_meal_plan(recipes, selected_diet)
         self.assertEqual(len(meal_plan), 7)  # Meal plan should have 7 days
-    
+
+    # Test RecipeCatalog indexes
+    def test_recipe_catalog(self):
+        recipes = [
+            {"name": "Potato Soup", "tags": ["All"], "ingredients": [{"ingredient": "Potato", "quantity": 2, "unit": "potato"}]},
+            {"name": "Chicken Salad", "tags": ["Omni"], "ingredients": [{"ingredient": "chicken breast", "quantity": 4, "unit": "oz"}]},
+            {"name": "Baked Potato", "tags": ["Veg"], "ingredients": [{"ingredient": "potato", "quantity": 1, "unit": "potato"}]}
+        ]
+        catalog = RecipeCatalog(recipes)
+        self.assertEqual(len(catalog), 3)
+        self.assertIs(catalog.get("Chicken Salad"), recipes[1])
+        self.assertIsNone(catalog.get("Pizza"))
+        self.assertEqual([r["name"] for r in catalog.with_tags("veg", "all")], ["Potato Soup", "Baked Potato"])
+        self.assertEqual([r["name"] for r in catalog.using_ingredient("potato")], ["Potato Soup", "Baked Potato"])
+
+        # recommend_recipes accepts the catalog directly
+        recommended = recommend_recipes(catalog, {"selected_preference": {"diet": "vegan"}})
+        self.assertEqual([r["name"] for r in recommended], ["Potato Soup"])
+
+        # Malformed entries are skipped instead of crashing the catalog
+        catalog = RecipeCatalog(recipes + [{"name": "Mystery Stew", "tags": ["All"], "ingredients": [{"quantity": 1}]},
+                                           {"name": "Toast", "tags": [None, "Veg"], "ingredients": "bread"}, "Pizza"])
+        self.assertEqual(len(catalog), 3)
+        self.assertNotIn("Mystery Stew", catalog)
+
+    # Test the optimizing engine stays in the calorie window, never repeats in a day and is reproducible
+    def test_create_meal_plan_optimize(self):
+        recipes = load_recipes('project/recipes.json')
+        selected_diet = {"diet": "omnivore", "nutritional_goals": {"calories": 2000, "protein": 120, "carbs": 220, "fat": 70, "fiber": 30}}
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'meal_plan.txt')
+            first = create_meal_plan(recipes, selected_diet, output, engine='optimize', seed=7)
+            with open(output) as file:
+                first_text = file.read()
+            second = create_meal_plan(recipes, selected_diet, output, engine='optimize', seed=7)
+            with open(output) as file:
+                second_text = file.read()
+        self.assertEqual(first, second)
+        self.assertEqual(first_text, second_text)
+        for totals in first.values():
+            self.assertGreaterEqual(totals["calories"], 1800)
+            self.assertLessEqual(totals["calories"], 2200)
+        for block in first_text.split(":\n")[1:]:
+            names = [line.strip()[2:] for line in block.splitlines() if line.strip().startswith("- ")]
+            self.assertEqual(len(names), len(set(names)))
+
+        # A handful of candidates is searched exhaustively, so the day matches brute force
+        rng = random.Random(0)
+        goals = [2000, 120, 220, 70, 30]
+        distance = lambda rows: sum(((sum(nutrition[row][i] for row in rows) - goal) / goal) ** 2 for i, goal in enumerate(goals))
+        for seed in range(20):
+            nutrition = [[rng.uniform(60, 800), rng.uniform(0, 50), rng.uniform(0, 90), rng.uniform(0, 40), rng.uniform(0, 15)]
+                         for _ in range(rng.randint(5, 10))]
+            days = [rows for size in range(1, len(nutrition) + 1) for rows in itertools.combinations(range(len(nutrition)), size)
+                    if 1800 <= sum(nutrition[row][0] for row in rows) <= 2200]
+            if days:
+                picked = plan_day_optimize(np.array(nutrition), np.array(goals, dtype=float), 1800, 2200, random.Random(seed))
+                self.assertAlmostEqual(distance(picked), min(distance(rows) for rows in days))
+
+    # Test the random engine is still selectable and seeded
+    def test_create_meal_plan_random(self):
+        recipes = load_recipes('project/recipes.json')
+        selected_diet = {"diet": "vegan", "nutritional_goals": {"calories": 1400, "protein": 60, "carbs": 210, "fat": 50, "fiber": 35}}
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'meal_plan.txt')
+            first = create_meal_plan(recipes, selected_diet, output, engine='random', seed=3)
+            second = create_meal_plan(recipes, selected_diet, output, engine='random', seed=3)
+        self.assertEqual(first, second)
+        with self.assertRaises(ValueError):
+            create_meal_plan(recipes, selected_diet, engine='genetic')
+
+    # Test batch planning writes one file per user and a matching JSONL stream
+    def test_plan_batch(self):
+        recipes = load_recipes('project/recipes.json')
+        profiles = load_preferences('project/preferences.json')["user_preferences"]
+        profiles = [dict(profile, user_id=profile["diet"]) for profile in profiles]
+        profiles[0]["pantry"] = 'project/ingredients.csv'
+        with tempfile.TemporaryDirectory() as tmp:
+            written = plan_batch(profiles, recipes, output_dir=tmp, workers=2, seed=1)
+            self.assertEqual([result["user_id"] for result in written], [profile["diet"] for profile in profiles])
+            with open(os.path.join(tmp, 'omnivore.json')) as file:
+                omnivore = json.load(file)
+
+            jsonl_filename = os.path.join(tmp, 'plans.jsonl')
+            plan_batch(profiles, recipes, jsonl_filename=jsonl_filename, workers=2, seed=1)
+            with open(jsonl_filename) as file:
+                streamed = [json.loads(line) for line in file]
+        self.assertEqual(len(streamed), 4)
+        self.assertEqual(streamed[0], omnivore)
+        self.assertEqual(len(omnivore["meal_plan"]), 7)
+        # Shopping list matches the plan with the omnivore's pantry taken away
+        counts = {}
+        for names in omnivore["meal_plan"].values():
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        expected = build_shopping_list(counts, recipes, load_ingredients('project/ingredients.csv'))
+        self.assertEqual(omnivore["shopping_list"], expected)
+
+        # A profile that can't be planned gets an error record and the rest still finish
+        profiles.insert(1, {"user_id": "broken", "diet": "vegan"})
+        with tempfile.TemporaryDirectory() as tmp:
+            jsonl_filename = os.path.join(tmp, 'plans.jsonl')
+            results = plan_batch(profiles, recipes, jsonl_filename=jsonl_filename, workers=2, seed=1)
+            with open(jsonl_filename) as file:
+                streamed = [json.loads(line) for line in file]
+        self.assertEqual([result["user_id"] for result in streamed], [profile["user_id"] for profile in profiles])
+        self.assertIn("error", results[1])
+        self.assertIn("error", streamed[1])
+        self.assertEqual(streamed[0], omnivore)
+
+    # Test the in-memory MealPlan gives the same shopping list as re-reading meal_plan.txt
+    def test_meal_plan_object(self):
+        recipes = RecipeCatalog.from_file('project/recipes.json')
+        selected_diet = {"diet": "vegetarian", "nutritional_goals": {"calories": 1600, "protein": 75, "carbs": 210, "fat": 55, "fiber": 40}}
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'meal_plan.txt')
+            meal_plan = create_meal_plan(recipes.with_tags("veg", "all"), selected_diet, output, seed=2)
+            self.assertIsInstance(meal_plan, MealPlan)
+            self.assertEqual(parse_meal_plan(output), meal_plan.counts())
+
+            from_file = generate_shopping_list(output, 'project/recipes.json', 'project/ingredients.csv', None)
+            in_memory = generate_shopping_list(meal_plan, recipes, 'project/ingredients.csv', output)
+            self.assertEqual(from_file, in_memory)
+
+            json_output = os.path.join(tmp, 'meal_plan.json')
+            meal_plan.write_json(json_output)
+            with open(json_output) as file:
+                saved = json.load(file)
+        self.assertEqual(saved["meal_plan"]["Monday"], meal_plan.names("Monday"))
+        self.assertEqual(saved["day_nutrition_totals"], meal_plan.day_nutrition_totals)
+
+    # Test the streaming loader yields the same recipes as load_recipes, even across tiny chunks
+    def test_iter_recipes(self):
+        recipes = load_recipes('project/recipes.json')
+        self.assertEqual(list(iter_recipes('project/recipes.json')), recipes)
+        self.assertEqual(list(iter_recipes('project/recipes.json', chunk_size=3)), recipes)
+
+        # Validation and diet filtering consume the generator without building the full list
+        streamed = iter_valid_recipes(iter_recipes('project/recipes.json'))
+        recommended = recommend_recipes(streamed, {"selected_preference": {"diet": "vegan"}})
+        self.assertEqual(recommended, recommend_recipes(recipes, {"selected_preference": {"diet": "vegan"}}))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'recipes.json')
+            with open(filename, 'w') as file:
+                file.write('{"version": 1.5, "recipes": [{"name": "Toast"}, {"name": "Soup", "tags": ["All"]}]}')
+            self.assertEqual([r["name"] for r in iter_recipes(filename, chunk_size=2)], ["Toast", "Soup"])
+            self.assertEqual(list(iter_valid_recipes(iter_recipes(filename))), [])
+
+    # Test the compiled cache is used when fresh and rebuilt when recipes.json changes
+    def test_load_recipes_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'recipes.json')
+            with open(filename, 'w') as file:
+                json.dump({"recipes": [{"name": "Toast", "tags": ["All"]}]}, file)
+            self.assertEqual(load_recipes(filename), [{"name": "Toast", "tags": ["All"]}])
+            self.assertTrue(os.path.exists(os.path.join(tmp, CACHE_DIR_NAME, 'recipes.json.recipes.cache')))
+            self.assertEqual(load_recipes(filename), [{"name": "Toast", "tags": ["All"]}])
+
+            # Same content with a new timestamp still comes from the cache
+            os.utime(filename, ns=(1, 1))
+            self.assertEqual(load_recipes(filename), [{"name": "Toast", "tags": ["All"]}])
+
+            with open(filename, 'w') as file:
+                json.dump({"recipes": [{"name": "Soup", "tags": ["Veg"]}, {"name": "Toast", "tags": ["All"]}]}, file)
+            self.assertEqual([r["name"] for r in load_recipes(filename)], ["Soup", "Toast"])
+            self.assertEqual(load_recipes(os.path.join(tmp, 'missing.json')), {})
+
+    # Test shopping list units are normalized and the pantry is only taken away once
+    def test_build_shopping_list_units(self):
+        recipes = [
+            {"name": "Chicken Wrap", "tags": ["Omni"], "ingredients": [
+                {"ingredient": "chicken breast", "quantity": 4, "unit": "ounces"},
+                {"ingredient": "rice", "quantity": 0.5, "unit": "cups"},
+                {"ingredient": "tortilla", "quantity": 1, "unit": "tortilla"}]},
+            {"name": "Chicken Bowl", "tags": ["Omni"], "ingredients": [
+                {"ingredient": "Chicken Breast", "quantity": 6, "unit": "oz"},
+                {"ingredient": "rice", "quantity": 4, "unit": "tbsp"},
+                {"ingredient": "tortilla", "quantity": 2, "unit": "tortillas"}]}
+        ]
+        pantry = {"rice": {"quantity": 1, "unit": " cup"}, "tortilla": {"quantity": 4, "unit": " tortilla"}}
+        shopping_list = build_shopping_list({"Chicken Wrap": 2, "Chicken Bowl": 1}, recipes, pantry)
+        self.assertEqual(shopping_list, {
+            "chicken breast": {"quantity": 14, "unit": "oz"},
+            "rice": {"quantity": 0.25, "unit": "cup"},
+        })
+
+        # Many households in one call give the same answer as one at a time
+        plans = [{"Chicken Wrap": 1}, {"Chicken Bowl": 3}, {}]
+        pantries = [{}, pantry, pantry]
+        self.assertEqual(build_shopping_lists(plans, recipes, pantries),
+                         [build_shopping_list(plan, recipes, pantry) for plan, pantry in zip(plans, pantries)])
+
+        # Only the planned recipes pick the unit: cups in the catalog don't turn 28 tbsp into 1.75 cups
+        meal_plan = MealPlan()
+        for day in meal_plan:
+            meal_plan.add(day, dict(recipes[1], nutrition={"calories": 500, "protein": 30, "carbs": 60, "fat": 10, "fiber": 5}))
+        expected = {"chicken breast": {"quantity": 42, "unit": "oz"}, "rice": {"quantity": 28, "unit": "tbsp"},
+                    "tortilla": {"quantity": 14, "unit": "tortilla"}}
+        self.assertEqual(build_shopping_list(meal_plan, recipes, {}), expected)
+        self.assertEqual(build_shopping_list({"Chicken Bowl": 7}, recipes, {}), expected)
+        self.assertEqual(build_shopping_lists([{"Chicken Bowl": 7}, {"Chicken Wrap": 1}], recipes, [{}, {}])[0], expected)
+
+    # Test the plan cache counts hits/misses/evictions, persists to disk and notices recipe changes
+    def test_plan_cache(self):
+        selected_diet = {"diet": "vegan", "nutritional_goals": {"calories": 1400, "protein": 60, "carbs": 210, "fat": 50, "fiber": 35}}
+        with tempfile.TemporaryDirectory() as tmp:
+            recipes_file = os.path.join(tmp, 'recipes.json')
+            with open(recipes_file, 'w') as file:
+                json.dump({"recipes": load_recipes('project/recipes.json')}, file)
+            recipes = RecipeCatalog.from_file(recipes_file)
+            selected = recipes.with_tags("all")
+            pantry = load_ingredients('project/ingredients.csv')
+            cache = PlanCache(max_entries=1, directory=os.path.join(tmp, 'plans'))
+
+            first = cached_meal_plan(cache, recipes, selected, selected_diet, pantry, seed=1)
+            self.assertIs(cached_meal_plan(cache, recipes, selected, selected_diet, pantry, seed=1), first)
+            cached_meal_plan(cache, recipes, selected, selected_diet, {}, seed=1)  # different pantry, evicts the first
+            self.assertEqual(cache.stats(), {"entries": 1, "hits": 1, "disk_hits": 0, "misses": 2, "evictions": 1})
+
+            # A new cache over the same folder picks the plan up from disk
+            restarted = PlanCache(directory=os.path.join(tmp, 'plans'))
+            meal_plan, shopping_list = cached_meal_plan(restarted, recipes, selected, selected_diet, pantry, seed=1)
+            self.assertEqual(restarted.stats()["disk_hits"], 1)
+            self.assertEqual(meal_plan.counts(), first[0].counts())
+            self.assertEqual(shopping_list, first[1])
+
+            # Changing recipes.json doesn't change what the loaded catalog plans with, and
+            # the reloaded catalog doesn't get plans made from the old recipes
+            changed = load_recipes('project/recipes.json')
+            for recipe in changed:
+                for ingredient in recipe["ingredients"]:
+                    ingredient["quantity"] *= 5
+            with open(recipes_file, 'w') as file:
+                json.dump({"recipes": changed}, file)
+            stale = cached_meal_plan(restarted, recipes, selected, selected_diet, {}, seed=1)[1]
+            self.assertEqual(stale, build_shopping_list(meal_plan, recipes, {}))
+            reloaded = RecipeCatalog.from_file(recipes_file)
+            meal_plan, shopping_list = cached_meal_plan(restarted, reloaded, reloaded.with_tags("all"), selected_diet, {}, seed=1)
+            self.assertEqual(restarted.stats()["misses"], 1)
+            self.assertEqual(shopping_list, build_shopping_list(meal_plan, reloaded, {}))
+            self.assertNotEqual(shopping_list, stale)
+
+    # Test the benchmark data generator writes files the loaders accept
+    def test_synthetic_data(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            recipes_file, ingredients_file, preferences_file = generate(tmp, 50, seed=1)
+            recipes = load_recipes(recipes_file, use_cache=False)
+            self.assertEqual(len(list(iter_valid_recipes(recipes))), 50)
+            self.assertTrue(load_ingredients(ingredients_file, use_cache=False))
+            self.assertEqual(len(load_preferences(preferences_file, use_cache=False)["user_preferences"]), 4)
+
+    # Test metrics record stages, planner rejections and skipped pantry rows, and cost nothing once disabled
+    def test_metrics(self):
+        events = []
+        metrics = enable_metrics(callback=lambda kind, name, value: events.append((kind, name)))
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                pantry_file = os.path.join(tmp, 'ingredients.csv')
+                with open(pantry_file, 'w') as file:
+                    file.write("ingredient, quantity, unit\negg,12, egg\n,3, slice\nrice,lots, cup\n")
+                load_ingredients(pantry_file)
+                load_ingredients(pantry_file)  # From the cache, the bad rows are still counted
+                recipes = load_recipes('project/recipes.json')
+                selected_diet = {"diet": "vegan", "nutritional_goals": {"calories": 1400, "protein": 60, "carbs": 210, "fat": 50, "fiber": 35}}
+                create_meal_plan(recipes, selected_diet, os.path.join(tmp, 'meal_plan.txt'), engine='random', seed=1)
+        finally:
+            self.assertIs(disable_metrics(), metrics)
+
+        recorded = metrics.to_json()
+        self.assertEqual(recorded["counters"]["load_ingredients.rows_skipped"], 2)
+        self.assertEqual(recorded["counters"]["load_ingredients.invalid_quantities"], 2)
+        self.assertEqual(recorded["counters"]["load_cached.ingredients.hit"], 1)
+        self.assertGreater(recorded["counters"]["plan_day_random.attempts"], 0)
+        self.assertEqual(recorded["stages"]["plan_meals"]["calls"], 1)
+        self.assertEqual(recorded["values"]["plan_meals.candidates"], 40)
+        self.assertIn(("stage", "load_recipes"), events)
+
+        # Nothing is recorded after disabling
+        load_recipes('project/recipes.json')
+        self.assertEqual(metrics.stages["load_recipes"]["calls"], 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_filename = os.path.join(tmp, 'run.prof')
+            self.assertEqual(len(profile_run(load_recipes, 'project/recipes.json', output_filename=profile_filename)), 40)
+            self.assertTrue(os.path.getsize(profile_filename) > 0)
+
+    # Test the headless pipeline runs without prompts and only imports matplotlib for a chart
+    def test_run_headless(self):
+        loaded = subprocess.run([sys.executable, "-c", "import sys, project.main_menu; print('matplotlib' in sys.modules)"],
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(loaded.stdout.strip(), "False")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'plan.json')
+            chart = os.path.join(tmp, 'plan.png')
+            meal_plan, shopping_list = run_headless('Vegan', 'project/recipes.json', 'project/preferences.json',
+                                                    'project/ingredients.csv', exclude=["Avocado Toast"], seed=4,
+                                                    output_filename=output, plot_filename=chart)
+            with open(output) as file:
+                saved = json.load(file)
+            self.assertTrue(os.path.getsize(chart) > 0)
+        self.assertEqual(saved["meal_plan"], meal_plan.to_json()["meal_plan"])
+        self.assertEqual(saved["shopping_list"], shopping_list)
+        self.assertNotIn("Avocado Toast", meal_plan.counts())
+
+        with self.assertRaises(ValueError):
+            run_headless('keto', 'project/recipes.json', 'project/preferences.json', 'project/ingredients.csv')
+
+    def test_render_nutrition_charts(self):
+        recipes = load_recipes('project/recipes.json')
+        plans = {}
+        for seed in range(3):
+            plans[f"user{seed}"] = create_meal_plan(recommend_recipes(recipes, {"selected_preference": {"diet": "vegan", "nutritional_goals": {"calories": 1500}}}),
+                                                    {"diet": "vegan", "nutritional_goals": {"calories": 1500}}, None, seed=seed)
+
+        images = render_nutrition_charts(plans)
+        self.assertEqual(set(images), set(plans))
+        self.assertTrue(all(image.startswith(b"\x89PNG") for image in images.values()))
+
+        # The re-used figure shows each plan's own totals
+        renderer = NutritionChartRenderer()
+        renderer.render(plans["user0"], format='svg')
+        tops = [bar.get_y() + bar.get_height() for bar in renderer.bars[-1]]
+        self.assertEqual(tops, [sum(plans["user0"][day].values()) for day in renderer.days])
+        # PNGs drawn over a saved background don't keep anything from the chart before
+        first = renderer.render(plans["user0"])
+        renderer.render(plans["user1"])
+        self.assertEqual(renderer.render(plans["user0"]), first)
+        self.assertEqual(first, images["user0"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            written = render_nutrition_charts(plans, tmp, 'svg', workers=2)
+            self.assertEqual(written["user1"], os.path.join(tmp, "user1.svg"))
+            with open(written["user1"]) as file:
+                self.assertIn("<svg", file.read())
+
+    def test_recommend_recipes_pantry(self):
+        recipes = [
+            {"name": "Toast", "tags": ["All"], "ingredients": [{"ingredient": "Bread", "quantity": 2, "unit": "slice"}], "nutrition": {}},
+            {"name": "Big Salad", "tags": ["All"], "ingredients": [{"ingredient": "lettuce", "quantity": 2, "unit": "cup"},
+                                                               {"ingredient": "oil", "quantity": 1, "unit": "tbsp"}], "nutrition": {}},
+            {"name": "Soup", "tags": ["Veg"], "ingredients": [{"ingredient": "lettuce", "quantity": 1, "unit": "cup"}], "nutrition": {}},
+        ]
+        pantry = {"lettuce": {"quantity": 1, "unit": " cups"}, "oil": {"quantity": 3, "unit": " tsp"}}
+
+        # Half the lettuce and all of the oil (3 tsp = 1 tbsp) are in the pantry
+        self.assertEqual(list(IngredientMatrix(recipes).coverage(pantry)), [0.0, 0.75, 1.0])
+
+        preferences = {"selected_preference": {"diet": "vegan"}}
+        ranked = recommend_recipes(recipes, preferences, pantry)
+        self.assertEqual([recipe["name"] for recipe in ranked], ["Big Salad", "Toast"])
+        top = recommend_recipes(RecipeCatalog(recipes), preferences, pantry, top_k=1)
+        self.assertEqual([recipe["name"] for recipe in top], ["Big Salad"])
+        # Without a pantry the old fewest-ingredients order is kept
+        self.assertEqual([recipe["name"] for recipe in recommend_recipes(recipes, preferences)], ["Toast", "Big Salad"])
+
+    def test_compact_recipe_catalog(self):
+        recipes = load_recipes('project/recipes.json')
+        catalog = RecipeCatalog(recipes)
+        compact = CompactRecipeCatalog.from_file('project/recipes.json')
+        self.assertEqual(len(compact), len(recipes))
+        self.assertEqual([dict(recipe) for recipe in compact], recipes)
+        self.assertEqual(compact.get("Chicken Quesadilla"), catalog.get("Chicken Quesadilla"))
+        self.assertEqual(compact.ids_using_ingredient("Tortilla"), catalog.ids_using_ingredient("tortilla"))
+
+        pantry = load_ingredients('project/ingredients.csv')
+        preferences = {"selected_preference": {"diet": "vegetarian", "nutritional_goals": {"calories": 1800}}}
+        recommended = recommend_recipes(compact, preferences, pantry)
+        self.assertEqual([recipe["name"] for recipe in recommended],
+                         [recipe["name"] for recipe in recommend_recipes(catalog, preferences, pantry)])
+
+        meal_plan = create_meal_plan(recommended, preferences["selected_preference"], None, seed=2)
+        expected = create_meal_plan(recommend_recipes(catalog, preferences, pantry), preferences["selected_preference"], None, seed=2)
+        self.assertEqual(meal_plan.to_json(), expected.to_json())
+        self.assertEqual(build_shopping_list(meal_plan.counts(), compact, pantry),
+                         build_shopping_list(meal_plan.counts(), catalog, pantry))
+
+        # Its read-only recipes pass the same checks as dicts, and SQLite stores load too
+        self.assertEqual(len(list(iter_valid_recipes(compact))), len(recipes))
+        with tempfile.TemporaryDirectory() as tmp:
+            store_file = os.path.join(tmp, 'planner.db')
+            import_store(store_file, 'project/recipes.json')
+            self.assertEqual([dict(recipe) for recipe in CompactRecipeCatalog.from_file(store_file)], recipes)
+
+        # Recipes with nutrition that isn't a number are skipped instead of crashing add()
+        self.assertIsNone(compact.add({"name": "Mystery Stew", "ingredients": [], "nutrition": {"calories": "high"}}))
+        self.assertIsNone(compact.add({"name": "Toast", "ingredients": [], "nutrition": ["calories"]}))
+        self.assertEqual(len(compact), len(recipes))
+
+    def test_meal_planner_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store_file = os.path.join(tmp, 'planner.db')
+            import_store(store_file, 'project/recipes.json', 'project/ingredients.csv', 'project/preferences.json')
+            # The loaders read the store like the files it was imported from
+            self.assertEqual(load_recipes(store_file), load_recipes('project/recipes.json'))
+            self.assertEqual(load_ingredients(store_file), load_ingredients('project/ingredients.csv'))
+            self.assertEqual(load_preferences(store_file), load_preferences('project/preferences.json'))
+
+            with MealPlannerStore(store_file) as store:
+                preferences = {"selected_preference": store.preference("Vegetarian")}
+                pantry = store.load_ingredients()
+                self.assertEqual([recipe["name"] for recipe in recommend_recipes(store, preferences, pantry)],
+                                 [recipe["name"] for recipe in recommend_recipes(load_recipes(store_file), preferences, pantry)])
+                self.assertEqual(store.recipes_using_ingredient("Tortilla"),
+                                 RecipeCatalog(load_recipes(store_file)).using_ingredient("tortilla"))
+                self.assertEqual(store.get("Chili"), RecipeCatalog(load_recipes(store_file)).get("Chili"))
+
+                store.update_pantry({"Egg": {"quantity": 3, "unit": " egg"}, "white bread": None})
+                store.adjust_pantry({"egg": -5, "milk": 1})
+                pantry = store.load_ingredients()
+            self.assertEqual(pantry["egg"], {"quantity": 0.0, "unit": "egg"})
+            self.assertNotIn("white bread", pantry)
+
+            # Opening an existing store doesn't create tables in files that aren't one
+            other_file = os.path.join(tmp, 'other.db')
+            sqlite3.connect(other_file).close()
+            with self.assertRaises(ValueError):
+                MealPlannerStore(other_file, create=False)
+            connection = sqlite3.connect(other_file)
+            self.assertEqual(connection.execute("SELECT count(*) FROM sqlite_master").fetchone(), (0,))
+            connection.close()
+
+    def test_incremental_planner(self):
+        recipes = load_recipes('project/recipes.json')
+        pantry = load_ingredients('project/ingredients.csv')
+        diet = load_preferences('project/preferences.json')["user_preferences"][1]
+        recommended = recommend_recipes(recipes, {"selected_preference": diet}, pantry)
+        planner = IncrementalPlanner(recommended, diet, pantry, seed=3)
+        self.assertEqual(planner.meal_plan.to_json(), create_meal_plan(recommended, diet, None, seed=3).to_json())
+        self.assertEqual(planner.shopping_list, build_shopping_list(planner.meal_plan, recipes, pantry))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            pantry_file = os.path.join(tmp, 'ingredients.csv')
+            with open('project/ingredients.csv') as source, open(pantry_file, 'w') as file:
+                file.write(source.read().replace("egg,12, egg", "egg,0, egg"))
+            # The plan needs eggs the pantry covered, only that line changes
+            self.assertEqual(planner.reload_pantry(pantry_file), ["egg"])
+            pantry = load_ingredients(pantry_file)
+        self.assertEqual(planner.shopping_list, build_shopping_list(planner.meal_plan, recipes, pantry))
+
+        removed = planner.meal_plan.names("Monday")[0]
+        before = {day: planner.meal_plan.names(day) for day in planner.meal_plan}
+        days = planner.remove_recipe(removed)
+        self.assertIn("Monday", days)
+        self.assertNotIn(removed, planner.meal_plan.counts())
+        for day in planner.meal_plan:
+            if day not in days:
+                self.assertEqual(planner.meal_plan.names(day), before[day])
+        self.assertEqual(planner.shopping_list, build_shopping_list(planner.meal_plan, recipes, pantry))
+
+    def test_plan_weeks(self):
+        recipes = load_recipes('project/recipes.json')
+        pantry = load_ingredients('project/ingredients.csv')
+        diet = load_preferences('project/preferences.json')["user_preferences"][0]
+        recommended = recommend_recipes(recipes, {"selected_preference": diet}, pantry)
+        plan = plan_weeks(recommended, diet, weeks=4, available_ingredients=pantry, seed=2,
+                          min_days_between=1, max_per_week=2, purchase_days=14)
+        self.assertEqual(len(plan.weeks), 4)
+
+        days = [week.names(day) for week in plan.weeks for day in week]
+        for yesterday, today in zip(days, days[1:]):
+            self.assertFalse(set(yesterday) & set(today))
+        for week in plan.weeks:
+            self.assertLessEqual(max(week.counts().values()), 2)
+        # Days are taken out of the pool once planned, so no whole day comes back
+        self.assertEqual(len({tuple(sorted(names)) for names in days}), len(days))
+
+        # When the limits leave no recipes at all, the day is planned from every recipe
+        single = plan_weeks(recipes[:1], diet, weeks=1, engine='random', seed=1)
+        self.assertEqual(single.weeks[0].counts(), {recipes[0]["name"]: 7})
+        limited = plan_weeks(recipes[:3], diet, weeks=2, engine='random', seed=1, max_per_week=1)
+        self.assertEqual(len(limited.weeks), 2)
+
+        # Two-week purchase windows, the first one uses the pantry like build_shopping_list
+        self.assertEqual(plan.purchase_windows(), [(1, 14), (15, 28)])
+        first_window = plan.weeks[0].counts() + plan.weeks[1].counts()
+        self.assertEqual(plan.shopping_lists[0], build_shopping_list(first_window, recipes, pantry))
+        self.assertEqual(plan_weeks(recommended, diet, weeks=4, available_ingredients=pantry, seed=2,
+                                    purchase_days=14).to_json(), plan.to_json())
+
+    def test_planning_service(self):
+        async def run(tmp):
+            recipes_file = shutil.copy('project/recipes.json', tmp)
+            preferences_file = shutil.copy('project/preferences.json', tmp)
+            pantry = load_ingredients('project/ingredients.csv')
+            async with PlanningService(recipes_file, preferences_file, workers=0, max_pending=2, reload_interval=0) as service:
+                client = PlanningClient(service)
+                result = await client.plan(diet="Vegan", pantry=pantry, seed=1, chart="svg")
+                diet = service.preferences["user_preferences"][2]
+                expected = create_meal_plan(recommend_recipes(load_recipes(recipes_file), {"selected_preference": diet}, pantry),
+                                            diet, None, seed=1)
+                self.assertEqual(result["meal_plan"], expected.to_json()["meal_plan"])
+                self.assertEqual(result["shopping_list"], build_shopping_list(expected, None, pantry))
+                self.assertTrue(result["chart"])
+
+                with self.assertRaises(ValueError):
+                    await client.plan(diet="keto")
+                # Only max_pending requests may wait, the rest are turned away
+                outcomes = await asyncio.gather(*(client.plan(diet="omnivore", seed=seed) for seed in range(4)),
+                                                return_exceptions=True)
+                self.assertEqual([isinstance(outcome, ServiceBusy) for outcome in outcomes], [False, False, True, True])
+
+                # Changed files are picked up without a restart
+                with open(recipes_file) as file:
+                    recipes = json.load(file)
+                recipes["recipes"] = recipes["recipes"][:10]
+                with open(recipes_file, 'w') as file:
+                    json.dump(recipes, file)
+                os.utime(recipes_file, ns=(1, 1))
+                self.assertTrue(await service.check_reload())
+                self.assertEqual((await client.health())["recipes"], 10)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(run(tmp))
+
+    def test_planning_service_errors(self):
+        class BrokenService(PlanningService):
+            async def plan(self, request):
+                raise RuntimeError("planner bug")
+
+        async def run(tmp):
+            recipes_file = shutil.copy('project/recipes.json', tmp)
+            preferences_file = shutil.copy('project/preferences.json', tmp)
+            async with PlanningService(recipes_file, preferences_file, workers=0, reload_interval=0) as service:
+                client = PlanningClient(service)
+                # A profile the planner can't use is turned away without failing the good request next to it
+                good, bad = await asyncio.gather(client.plan(diet="vegan", seed=1),
+                                                 client.plan(profile={"diet": "vegan"}, seed=1), return_exceptions=True)
+                self.assertIn("meal_plan", good)
+                self.assertIsInstance(bad, ValueError)
+                self.assertEqual((await client.request('POST', '/plan', [1]))[0], 400)
+                for request in ({"pantry": {"egg": {"quantity": 1, "unit": 5}}}, {"engine": ["x"]}, {"diet": ["vegan"]}):
+                    self.assertEqual((await client.request('POST', '/plan', request))[0], 400)
+
+                # A half-written recipes file keeps the catalog that was loaded
+                recipe_count = (await client.health())["recipes"]
+                with open(recipes_file, 'w') as file:
+                    file.write('{"recipes": [')
+                with self.assertRaises(ValueError):
+                    await service.check_reload()
+                self.assertEqual((await client.health())["recipes"], recipe_count)
+                with self.assertRaises(ValueError):
+                    await service.check_reload()  # Still broken, so it is tried again
+
+                # Requests still waiting when the service stops are answered
+                pending = [asyncio.ensure_future(client.plan(diet="omnivore", seed=seed)) for seed in range(40)]
+                await asyncio.sleep(0)
+            outcomes = await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 30)
+            self.assertTrue(all(isinstance(outcome, (dict, ServiceBusy)) for outcome in outcomes))
+            self.assertTrue(any(isinstance(outcome, ServiceBusy) for outcome in outcomes))
+
+            # Anything else is the service's fault and answered with a 500
+            async with BrokenService('project/recipes.json', preferences_file, workers=0, reload_interval=0) as service:
+                status, body = await PlanningClient(service).request('POST', '/plan', {"diet": "vegan"})
+                self.assertEqual(status, 500)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(run(tmp))
+
+    def test_load_pantry_bulk(self):
+        # Same pantry as load_ingredients for a clean file, with units stripped by both
+        self.assertEqual(dict(load_pantry_bulk('project/ingredients.csv')), load_ingredients('project/ingredients.csv', use_cache=False))
+        self.assertEqual(load_ingredients('project/ingredients.csv', use_cache=False)["white bread"]["unit"], "slice")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            inventory_file = os.path.join(tmp, 'inventory.csv')
+            with open(inventory_file, 'w') as file:
+                file.write("ingredient, quantity, unit\nFlour,2, lb\nflour ,8, ounces\nflour,1, cup\negg,6,\nEgg,6, eggs\n"
+                           ",3, cup\nmilk,lots, cup\nmilk,-1, cup\n\nmilk,1, cups\nmilk,4, tbsp\n\"salt, sea\",1, tsp\n")
+            # A tiny chunk size runs every block through both the quick and the csv module path
+            for chunk_size in (1 << 20, 16):
+                pantry = load_pantry_bulk(inventory_file, chunk_size=chunk_size)
+                self.assertEqual(pantry.to_dict(), {
+                    "flour": {"quantity": 2.5, "unit": "lb"}, "egg": {"quantity": 12.0, "unit": "egg"},
+                    "milk": {"quantity": 1.25, "unit": "cup"}, "salt, sea": {"quantity": 1.0, "unit": "tsp"}})
+                report = pantry.report
+                self.assertEqual((report.rows, report.loaded, report.merged), (11, 7, 3))
+                self.assertEqual(report.errors, {"missing_ingredient": 1, "invalid_quantity": 1, "negative_quantity": 1,
+                                                 "unit_conflict": 1})
+                self.assertIn((7, "invalid_quantity", "quantity is not a number: 'lots'"), report.examples)
+
+            # The merged pantry works wherever a pantry dict does
+            recipes = load_recipes('project/recipes.json')
+            preferences = {"selected_preference": {"diet": "vegetarian"}}
+            self.assertEqual(recommend_recipes(recipes, preferences, pantry), recommend_recipes(recipes, preferences, pantry.to_dict()))
+            pantry.write_csv(os.path.join(tmp, 'merged.csv'))
+            self.assertEqual(load_ingredients(os.path.join(tmp, 'merged.csv'), use_cache=False), pantry.to_dict())
+
 if __name__ == '__main__':
     unittest.main()